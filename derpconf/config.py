@@ -10,19 +10,389 @@
 
 import sys
 import os
+import contextlib
+import contextvars
+import functools
+import glob
+import json
+import ast
+import marshal
+import struct
+import re
+import hashlib
 import logging
+import time
+import threading
 from collections import defaultdict
-from os.path import join, exists, abspath, dirname, isdir
-import importlib
+from types import MappingProxyType
+from os.path import join, exists, abspath, dirname, basename, isdir
+from importlib.util import MAGIC_NUMBER
 
-import six
-from textwrap import fill
+from derpconf import loaders
 
 
 class ConfigurationError(RuntimeError):
     pass
 
 
+class ValidationError(ConfigurationError):
+    def __init__(self, errors):
+        self.errors = errors
+        super(ValidationError, self).__init__(
+            'Invalid configuration:\n%s' % '\n'.join('  %s: %s' % error for error in errors)
+        )
+
+
+class OptionSchema(object):
+    def __init__(self, key, type=None, choices=None, min_value=None, max_value=None, validators=None):
+        self.key = key
+        self.type = type
+        self.choices = choices
+        self.min_value = min_value
+        self.max_value = max_value
+        self.validators = list(validators or [])
+
+        # only the checks this option actually declares are run
+        self.checks = []
+
+        if type is not None:
+            self.checks.append(self.check_type)
+        if choices is not None:
+            self.checks.append(self.check_choices)
+        if min_value is not None or max_value is not None:
+            self.checks.append(self.check_range)
+        if self.validators:
+            self.checks.append(self.check_validators)
+
+    def coerce(self, value):
+        if self.type is None or isinstance(value, LazyValue):
+            return value
+
+        return coerce_to_type(value, self.type)
+
+    def errors(self, value):
+        try:
+            value = self.coerce(value)
+        except (TypeError, ValueError, SyntaxError):
+            return ['expected %s, got %r' % (type_name(self.type), value)]
+
+        errors = []
+
+        for check in self.checks:
+            error = check(value)
+
+            if error is not None:
+                errors.append(error)
+
+        return errors
+
+    def check_type(self, value):
+        if not isinstance(value, self.type):
+            return 'expected %s, got %r' % (type_name(self.type), value)
+
+    def check_choices(self, value):
+        if value not in self.choices:
+            return '%r is not one of %s' % (value, ', '.join(repr(choice) for choice in self.choices))
+
+    def check_range(self, value):
+        try:
+            if self.min_value is not None and value < self.min_value:
+                return '%r is less than %r' % (value, self.min_value)
+            if self.max_value is not None and value > self.max_value:
+                return '%r is greater than %r' % (value, self.max_value)
+        except TypeError:
+            return '%r can not be compared to %r..%r' % (value, self.min_value, self.max_value)
+
+    def check_validators(self, value):
+        for validator in self.validators:
+            try:
+                valid = validator(value)
+            except (TypeError, ValueError) as error:
+                return str(error)
+
+            if valid is False:
+                return '%r is not valid' % (value,)
+
+
+class LazyValue(object):
+    _lock = threading.RLock()
+
+    def __init__(self, function):
+        self.function = function
+        self.evaluated = False
+        self.value = None
+
+    def evaluate(self):
+        if not self.evaluated:
+            with LazyValue._lock:
+                if not self.evaluated:
+                    self.value = self.function()
+                    self.evaluated = True
+
+        return self.value
+
+    def __repr__(self):
+        if self.evaluated:
+            return 'lazy(%r)' % (self.value,)
+        return 'lazy(%s)' % getattr(self.function, '__name__', repr(self.function))
+
+
+def lazy(function):
+    return LazyValue(function)
+
+
+def hashable_value(value):
+    if isinstance(value, (tuple, list)):
+        return tuple(hashable_value(item) for item in value)
+
+    if isinstance(value, dict):
+        return frozenset((key, hashable_value(item)) for key, item in value.items())
+
+    if isinstance(value, (set, frozenset)):
+        return frozenset(hashable_value(item) for item in value)
+
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+
+    return value
+
+
+class FrozenConfig(object):
+    __slots__ = ('_values', '_lookup', '_hash')
+
+    def __init__(self, values):
+        values = dict(values)
+
+        object.__setattr__(self, '_values', MappingProxyType(values))
+        object.__setattr__(self, '_lookup', dict(
+            (key, value) for key, value in values.items() if not hasattr(FrozenConfig, key)
+        ))
+        object.__setattr__(self, '_hash', None)
+
+    @property
+    def items(self):
+        return self._values
+
+    def keys(self):
+        return self._values.keys()
+
+    def get(self, name, default=None):
+        return self._values.get(name, default)
+
+    def __getattribute__(self, name):
+        try:
+            return _frozen_lookup(self)[name]
+        except (KeyError, AttributeError):
+            return object.__getattribute__(self, name)
+
+    def __getitem__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise KeyError('No config called \'%s\'' % name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Frozen configurations are read-only.')
+
+    def __delattr__(self, name):
+        raise AttributeError('Frozen configurations are read-only.')
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenConfig):
+            return NotImplemented
+        return self._values == other._values
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash(hashable_value(dict(self._values))))
+        return self._hash
+
+    def __reduce__(self):
+        return (FrozenConfig, (dict(self._values),))
+
+    def __repr__(self):
+        return 'FrozenConfig(%r)' % (dict(self._values),)
+
+
+_frozen_lookup = FrozenConfig._lookup.__get__
+
+
+class ConfigOverlay(object):
+    # a view of a configuration with a few values layered on top; anything
+    # else is read from the configuration itself, as it is at the time
+    __slots__ = ('_config', '_values')
+
+    def __init__(self, config, values):
+        object.__setattr__(self, '_config', config)
+        object.__setattr__(self, '_values', values)
+
+    @property
+    def items(self):
+        values = dict(self._config.items)
+        aliased_items = self._config.class_aliased_items
+
+        for key in self._values:
+            if key not in aliased_items:
+                values[key] = self.__getattribute__(key)
+
+        return MappingProxyType(values)
+
+    def get(self, name, default=None):
+        try:
+            return self.__getattribute__(name)
+        except AttributeError:
+            return default
+
+    def source_of(self, name):
+        if name in self._values:
+            return 'overlay'
+
+        return self._config.source_of(name)
+
+    def section(self, prefix):
+        return ConfigSection(self, prefix.strip('_'))
+
+    def overlay(self, values):
+        layered = dict(self._values)
+        layered.update(self._config._overlay_values(values))
+
+        return ConfigOverlay(self._config, layered)
+
+    def __getattribute__(self, name):
+        values = _overlay_values(self)
+
+        if name in values:
+            value = values[name]
+
+            if value.__class__ is LazyValue:
+                value = values[name] = value.evaluate()
+
+            return value
+
+        if name in OVERLAY_ATTRIBUTES:
+            return object.__getattribute__(self, name)
+
+        return getattr(_overlay_config(self), name)
+
+    def __getitem__(self, name):
+        try:
+            return self.__getattribute__(name)
+        except AttributeError:
+            raise KeyError('No config called \'%s\'' % name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Configuration overlays are read-only.')
+
+    def __delattr__(self, name):
+        raise AttributeError('Configuration overlays are read-only.')
+
+    def __repr__(self):
+        return 'ConfigOverlay(%r, %r)' % (self._config, self._values)
+
+
+_overlay_values = ConfigOverlay._values.__get__
+_overlay_config = ConfigOverlay._config.__get__
+OVERLAY_ATTRIBUTES = frozenset(dir(ConfigOverlay))
+
+class ConfigSection(object):
+    # the keys of a configuration that start with a prefix, read without it:
+    # conf.section('STORAGE_S3').BUCKET is conf.STORAGE_S3_BUCKET
+    __slots__ = ('_config', '_prefix', '_start')
+
+    def __init__(self, config, prefix):
+        object.__setattr__(self, '_config', config)
+        object.__setattr__(self, '_prefix', prefix)
+        object.__setattr__(self, '_start', prefix + '_')
+
+    @property
+    def items(self):
+        return MappingProxyType(dict((name, self[name]) for name in self.keys()))
+
+    def keys(self):
+        start = len(self._start)
+        return [key[start:] for key in self._config._section_keys(self._prefix)]
+
+    def get(self, name, default=None):
+        return getattr(self._config, self._start + name, default)
+
+    def section(self, prefix):
+        return ConfigSection(self._config, self._start + prefix.strip('_'))
+
+    def __getattribute__(self, name):
+        if name in SECTION_ATTRIBUTES:
+            return object.__getattribute__(self, name)
+
+        return getattr(_section_config(self), _section_start(self) + name)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self._config, self._start + name)
+        except AttributeError:
+            raise KeyError('No config called \'%s%s\'' % (self._start, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Configuration sections are read-only.')
+
+    def __contains__(self, name):
+        return self._start + name in self._config._section_keys(self._prefix)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._config._section_keys(self._prefix))
+
+    def __repr__(self):
+        return 'ConfigSection(%r, %r)' % (self._config, self._prefix)
+
+
+_section_config = ConfigSection._config.__get__
+_section_start = ConfigSection._start.__get__
+SECTION_ATTRIBUTES = frozenset(dir(ConfigSection))
+
+
+def section_prefixes(key):
+    # STORAGE_S3_BUCKET is in the STORAGE and STORAGE_S3 sections
+    position = key.find('_', 1)
+
+    while position != -1:
+        yield key[:position]
+        position = key.find('_', position + 1)
+
+
+# the values of every override entered in the current thread or task, by
+# configuration instance; reads only look them up while some thread has
+# entered an override
+_overrides = contextvars.ContextVar('derpconf_overrides', default=None)
+_overriding = [0]
+_overriding_lock = threading.Lock()
+
+# values are resolved from layers, lowest priority first: class defaults,
+# instance defaults, then the values loaded from files or set on the instance.
+# Sources added with add_source go in between, or above loaded values when
+# their priority is VALUES_PRIORITY or more. Environment variables, when
+# allowed, are above everything else but the values of override().
+CLASS_DEFAULTS_PRIORITY = 0
+DEFAULTS_PRIORITY = 100
+SOURCE_PRIORITY = 150
+VALUES_PRIORITY = 200
+
+
 class Config(object):
     class_defaults = {}
     class_group_items = defaultdict(list)
@@ -31,24 +401,141 @@ class Config(object):
 
     class_aliases = defaultdict(list)
     class_aliased_items = {}
+    class_schema = {}
     _allow_environment_variables = False
+    _environment = None
+    _environment_names = {}
+
+    # bumped whenever the option registry changes, so instances know
+    # their resolution table is stale
+    _generation = 0
+
+    # when enabled, compiled configuration files are cached in
+    # bytecode_cache_dir, or in a derpconf folder of the user's cache
+    # directory (never next to them, where folders such as /etc would get
+    # cache files of their own). Every class counts its own hits and misses
+    bytecode_cache = False
+    bytecode_cache_dir = None
+    bytecode_cache_stats = {'hits': 0, 'misses': 0}
+    _stats_lock = threading.Lock()
+
+    # 'auto' reads files made only of literal assignments without executing
+    # them, 'literal' refuses any other file and 'exec' always executes them
+    parse_mode = 'auto'
+
+    # folders are read with this many threads (or processes, which need
+    # the configuration class and values to be picklable)
+    load_workers = None
+    load_executor = 'thread'
+
+    # options defined or aliased on this class itself, which are not
+    # overwritten by later defines on its parents
+    _own_options = set()
+    _inherited_registries = frozenset()
+
+    def __init_subclass__(cls, **kw):
+        super(Config, cls).__init_subclass__(**kw)
+
+        # subclasses get their own copy of any registry they do not declare,
+        # so their options do not leak into their parents
+        cls._inherited_registries = frozenset(name for name in REGISTRIES if name not in cls.__dict__)
+        cls._own_options = set()
+
+        for name in cls._inherited_registries:
+            setattr(cls, name, copy_registry(getattr(cls, name)))
+
+        if 'bytecode_cache_stats' not in cls.__dict__:
+            cls.bytecode_cache_stats = {'hits': 0, 'misses': 0}
 
     @classmethod
-    def define(cls, key, value, description, group='General'):
+    def define(cls, key, value, description, group='General', type=None, choices=None,
+               min_value=None, max_value=None, validators=None):
+        if any(option is not None for option in (type, choices, min_value, max_value, validators)):
+            schema = OptionSchema(key, type, choices, min_value, max_value, validators)
+        else:
+            schema = None
+
+        cls._own_options.add(key)
+
+        for klass in cls.__registry_classes(key, 'class_defaults'):
+            klass.__define(key, value, description, group, schema)
+
+        cls.invalidate()
+
+    @classmethod
+    def __define(cls, key, value, description, group, schema):
+        # group membership is checked against the group index, not the
+        # ordered list of groups. Options redefined in another group move
+        # to it, and groups left empty are dropped
+        previous = None
+
+        if key in cls.class_defaults:
+            previous = next((name for name, keys in cls.class_group_items.items() if key in keys), None)
+
+        if previous != group:
+            if previous is not None:
+                cls.class_group_items[previous].remove(key)
+
+                if not cls.class_group_items[previous]:
+                    del cls.class_group_items[previous]
+                    cls.class_groups.remove(previous)
+
+            if group not in cls.class_group_items:
+                cls.class_groups.append(group)
+            cls.class_group_items[group].append(key)
+
         cls.class_defaults[key] = value
         cls.class_descriptions[key] = description
-        cls.class_group_items[group].append(key)
 
-        if group not in cls.class_groups:
-            cls.class_groups.append(group)
+        if schema is not None:
+            cls.class_schema[key] = schema
+        else:
+            cls.class_schema.pop(key, None)
 
     @classmethod
     def alias(cls, new_key, aliased_key):
-        if aliased_key in cls.class_aliased_items:
-            aliased_key = cls.class_aliased_items[aliased_key]
+        if cls._canonical(aliased_key) == new_key:
+            raise ConfigurationError('Aliasing %s to itself would create a cycle.' % new_key)
+
+        cls._own_options.add(new_key)
+
+        for klass in cls.__registry_classes(new_key, 'class_aliased_items'):
+            klass.__alias(new_key, aliased_key)
+
+        cls.invalidate()
+
+    @classmethod
+    def __alias(cls, new_key, aliased_key):
+        # aliases always point straight at the canonical key, so resolving
+        # one is a single lookup however the aliases were chained
+        aliased_key = cls._canonical(aliased_key)
+
+        if aliased_key == new_key:
+            return
+
         cls.class_aliases[aliased_key].append(new_key)
         cls.class_aliased_items[new_key] = aliased_key
 
+        # keys that were aliases of new_key now stand for aliased_key
+        for alias in cls.class_aliases.pop(new_key, []):
+            cls.class_aliased_items[alias] = aliased_key
+            cls.class_aliases[aliased_key].append(alias)
+
+    @classmethod
+    def __registry_classes(cls, key, registry):
+        # this class, then the subclasses that inherited the registry and
+        # did not define the option themselves
+        yield cls
+
+        for subclass in cls.__subclasses__():
+            if registry in subclass._inherited_registries and key not in subclass._own_options:
+                for klass in subclass.__registry_classes(key, registry):
+                    yield klass
+
+    @classmethod
+    def invalidate(cls):
+        Config._generation += 1
+
     @classmethod
     def get_conf_file(cls, conf_name, lookup_paths):
         for conf_path in lookup_paths:
@@ -60,120 +547,1024 @@ class Config(object):
         return None
 
     @classmethod
-    def allow_environment_variables(cls):
+    def allow_environment_variables(cls, snapshot=False, names=None):
         cls._allow_environment_variables = True
+        cls._environment_names = dict(names or {})
+        cls._environment = None
+
+        if snapshot:
+            cls.refresh_environment()
+
+    @classmethod
+    def refresh_environment(cls):
+        names = cls._environment_names
+        environment = {}
+
+        for key in set(cls.class_defaults) | set(cls.class_aliased_items) | set(names):
+            value = os.environ.get(names.get(key, key), None)
+
+            if value is not None:
+                environment[key] = cls.__coerce(key, value)
+
+        cls._environment = environment
+
+    @classmethod
+    def __coerce(cls, key, value):
+        canonical = cls._canonical(key)
+        default = cls.class_defaults.get(canonical, None)
+        schema = cls.class_schema.get(canonical)
+
+        try:
+            if schema is not None and schema.type is not None:
+                return schema.coerce(value)
+            return coerce_value(value, default)
+        except (TypeError, ValueError, SyntaxError):
+            raise ConfigurationError(
+                'Environment variable for %s could not be converted to %s: %r' % (
+                    key, type_name(schema.type if schema is not None and schema.type else type(default)), value
+                )
+            )
+
+    @classmethod
+    def _coerce_loaded(cls, key, value, strings=False):
+        # values from files are converted once, when they are loaded; values
+        # that can't be converted are kept as is and reported by validate().
+        # Formats that only have strings (strings=True) are converted to the
+        # type of the default, like environment variables are
+        schema = cls.class_schema.get(key)
+
+        try:
+            if schema is not None and schema.type is not None:
+                return schema.coerce(value)
+
+            if strings and isinstance(value, str):
+                return coerce_value(value, cls.class_defaults.get(key))
+        except (TypeError, ValueError, SyntaxError):
+            pass
+
+        return value
+
+    @classmethod
+    def _canonical(cls, key):
+        return cls.class_aliased_items.get(key, key)
 
     @classmethod
-    def load(cls, path, conf_name=None, lookup_paths=[], defaults={}):
+    def load(cls, path, conf_name=None, lookup_paths=[], defaults={}, validate=False, format=None, workers=None,
+             remote=None):
+        if cls._environment is not None:
+            cls.refresh_environment()
+
         if path is None and conf_name is not None and lookup_paths:
             path = cls.get_conf_file(conf_name, lookup_paths)
 
-        if path is None:
-            return cls(defaults=defaults)
+        conf = cls(defaults=defaults)
 
-        if not exists(path):
-            raise ConfigurationError('Configuration file not found at path %s' % path)
+        # remote sources come below the files, which can override them
+        if remote is not None:
+            conf._remotes = list(remote) if isinstance(remote, (list, tuple)) else [remote]
+            cls.__load_remotes(conf)
 
-        conf = cls(defaults=defaults)
+        if path is not None:
+            if not exists(path):
+                raise ConfigurationError('Configuration file not found at path %s' % path)
+
+            cls.__load_from_path(conf, path, format, workers)
 
-        return cls.__load_from_path(conf, path)
+        if validate:
+            conf.validate()
+
+        return conf
 
     @classmethod
-    def __load_from_path(cls, conf, path):
+    def __load_from_path(cls, conf, path, format=None, workers=None):
+        # kept so that reloads read files with as many workers
+        conf._load_workers = workers
+
         if isdir(path):
             conf.config_folder = path
-            files = sorted(os.listdir(path))
+            paths = cls.get_folder_files(path)
+            format = None
+        else:
+            paths = [path]
+
+        states = [cls.__file_state(filepath) for filepath in paths]
+
+        for state in states:
+            state['format'] = format
+
+        # files are read concurrently but merged in order, so later files
+        # still override earlier ones
+        results = cls.__read_files([(filepath, state['format']) for filepath, state in zip(paths, states)], workers)
+
+        for filepath, state, (values, timings) in zip(paths, states, results):
+            state['timings'] = timings
+            conf.config_file = filepath
+            conf._files[filepath] = state
+            strings = loaders.is_string_format(filepath, state['format'])
+
+            for name, value in values.items():
+                key = cls._canonical(name)
+                value = cls._coerce_loaded(key, value, strings)
+                state['values'][key] = value
+                conf._items[name] = value
+                setattr(conf, name, value)
+
+        return conf
+
+    @classmethod
+    def __load_remotes(cls, conf):
+        for source in conf._remotes:
+            state = cls.__remote_state(source.load())
+            conf._files[source.name] = state
+
+            for key, value in state['values'].items():
+                conf._items[key] = value
+                setattr(conf, key, value)
+
+    @classmethod
+    def __remote_state(cls, state):
+        values = {}
 
-            for file in files:
-                if file.endswith('.conf'):
-                    filepath = path + os.sep + file
-                    conf = Config.__load_from_path(conf, filepath)
+        for name, value in state['values'].items():
+            key = cls._canonical(name)
+            values[key] = cls._coerce_loaded(key, value)
 
-            return conf
+        state['values'] = values
+
+        return state
+
+    @classmethod
+    def __read_files(cls, jobs, workers=None):
+        if workers is None:
+            workers = cls.load_workers
+
+        if not workers or len(jobs) < 2:
+            return [cls._read_file(path, format) for path, format in jobs]
+
+        if cls.load_executor == 'process':
+            from concurrent.futures import ProcessPoolExecutor
+
+            chunksize = max(1, len(jobs) // (workers * 4))
+
+            with ProcessPoolExecutor(workers) as executor:
+                results = list(executor.map(cls._read_counted, *zip(*jobs), chunksize=chunksize))
+
+            # cache hits and misses of the worker processes are counted here
+            for values, timings, counts in results:
+                for name, count in counts.items():
+                    cls.__count(name, count)
+
+            return [(values, timings) for values, timings, counts in results]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(workers) as executor:
+            return list(executor.map(cls._read_file, *zip(*jobs)))
+
+    @classmethod
+    def _read_counted(cls, path, format=None):
+        # reads a file in a worker process, along with the cache hits and
+        # misses it took
+        before = dict(cls.bytecode_cache_stats)
+        values, timings = cls._read_file(path, format)
+
+        return values, timings, dict((name, count - before[name]) for name, count in cls.bytecode_cache_stats.items())
+
+    @classmethod
+    def _read_file(cls, path, format=None):
+        started = time.perf_counter()
+        timings = {}
+
+        namespace = cls.__execute(path, format, timings)
+        values = dict((name, value) for name, value in namespace.items() if name.upper() == name)
+
+        timings['total'] = time.perf_counter() - started
+        logging.debug('Configuration file %s loaded in %.2fms (read %.2fms, compile %.2fms, exec %.2fms).' % (
+            path, timings['total'] * 1000, timings['read'] * 1000, timings['compile'] * 1000, timings['exec'] * 1000
+        ))
+
+        return values, timings
+
+    @classmethod
+    def get_folder_files(cls, path):
+        return [path + os.sep + file for file in sorted(os.listdir(path)) if loaders.is_configuration_file(file)]
+
+    @classmethod
+    def __file_state(cls, path, previous=None):
+        stat = os.stat(path)
+        state = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': None, 'values': {},
+                 'format': previous['format'] if previous is not None else None}
+
+        if previous is None:
+            return state
+
+        if previous['mtime'] == state['mtime'] and previous['size'] == state['size']:
+            return previous
+
+        # files are only hashed on reload, once they were touched without
+        # changing size, so loading does not read every file twice. A file
+        # touched for the first time since it was loaded is read again
+        if previous['size'] != state['size']:
+            return state
+
+        with open(path, 'rb') as config_file:
+            state['hash'] = hashlib.sha1(config_file.read()).hexdigest()
+
+        # the state of a file touched without changing keeps its values,
+        # previous itself is never changed as it may still be in use
+        if previous['hash'] == state['hash']:
+            return dict(previous, mtime=state['mtime'])
+
+        return state
+
+    @classmethod
+    def __execute(cls, path, format=None, timings=None):
+        # timings, when given, receives the seconds spent reading, compiling
+        # (or parsing) and executing the file
+        if timings is None:
+            timings = {}
+
+        timings.update(read=0.0, compile=0.0, exec=0.0)
+
+        try:
+            format = loaders.get_format(path, format)
+        except ValueError as error:
+            raise ConfigurationError(str(error))
+
+        clock = time.perf_counter
+        started = clock()
+
+        # other formats are read and parsed in a single step
+        if format != 'python':
+            try:
+                values = loaders.LOADERS[format](path)
+            except ImportError as error:
+                raise ConfigurationError(str(error))
+
+            timings['read'] = clock() - started
+
+            return values
+
+        # the file is looked at once, before it is read, so that a cache
+        # written for it never claims a newer version than the one read
+        stat = os.stat(path)
+        cached = cls.__read_cache(path, stat)
+
+        if cached is not None:
+            kind, cached = cached
+
+            if kind == CACHED_VALUES:
+                timings['read'] = clock() - started
+                return cached
+
+            if cls.parse_mode != 'literal':
+                timings['read'] = clock() - started
+                return cls.__run(cached, timings)
 
         with open(path) as config_file:
-            name = 'configuration'
-            code = config_file.read()
-            spec = importlib._bootstrap.ModuleSpec(name, None)
-            module = importlib.util.module_from_spec(spec)
+            source = config_file.read()
+
+        timings['read'] = clock() - started
+        started = clock()
+
+        if cls.parse_mode != 'exec':
+            values = parse_literal_config(source)
+
+            if values is not None:
+                cls.__write_cache(path, stat, CACHED_VALUES, values)
+                timings['compile'] = clock() - started
+                return values
+
+            if cls.parse_mode == 'literal':
+                raise ConfigurationError(
+                    'Configuration file %s has statements other than literal assignments.' % path
+                )
 
-            six.exec_(code, module.__dict__)
+        code = compile(source, path, 'exec')
+        cls.__write_cache(path, stat, CACHED_CODE, code)
+        timings['compile'] = clock() - started
 
-            conf.config_file = path
+        return cls.__run(code, timings)
 
-            for name, value in module.__dict__.items():
-                if name.upper() == name:
-                    conf._items[name] = value
-                    setattr(conf, name, value)
+    @classmethod
+    def __run(cls, code, timings=None):
+        namespace = {'__name__': 'configuration'}
+
+        started = time.perf_counter()
+        exec(code, namespace)
+
+        if timings is not None:
+            timings['exec'] = time.perf_counter() - started
+
+        return namespace
+
+    @classmethod
+    def __cache_header(cls, stat):
+        return MAGIC_NUMBER + struct.pack('<qq', stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def __read_cache(cls, path, stat):
+        # the cache holds either the compiled code of a file or, for files
+        # made only of literal assignments, the values themselves
+        if not cls.bytecode_cache:
+            return None
 
-            return conf
+        header = cls.__cache_header(stat)
+
+        try:
+            with open(cls.get_bytecode_path(path), 'rb') as cache_file:
+                data = cache_file.read()
+
+            if data[:len(header)] == header:
+                kind = data[len(header):len(header) + 1]
+                cached = marshal.loads(data[len(header) + 1:])
+                cls.__count('hits')
+                return kind, cached
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+        cls.__count('misses')
+
+        return None
+
+    @classmethod
+    def __count(cls, name, count=1):
+        with Config._stats_lock:
+            cls.bytecode_cache_stats[name] += count
 
     @classmethod
-    def verify(cls, path):
+    def __write_cache(cls, path, stat, kind, value):
+        if not cls.bytecode_cache:
+            return
+
+        header = cls.__cache_header(stat)
+        cache_path = cls.get_bytecode_path(path)
+
+        # the cache holds what the file holds, so it is no more readable
+        # than the file itself, like importlib does for bytecode
+        mode = (stat.st_mode & 0o666) | 0o200
+
+        # written to a temporary file and renamed so that concurrent
+        # workers never read a partially written cache
+        temp_path = '%s.%d.%s.tmp' % (cache_path, os.getpid(), id(value))
+
+        try:
+            cache_dir = dirname(cache_path)
+            if not isdir(cache_dir):
+                os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+            descriptor = os.open(temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, mode)
+
+            with os.fdopen(descriptor, 'wb') as cache_file:
+                cache_file.write(header + kind + marshal.dumps(value))
+
+            os.replace(temp_path, cache_path)
+        except (OSError, ValueError):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    @classmethod
+    def get_bytecode_path(cls, path):
+        path = abspath(path)
+        tag = sys.implementation.cache_tag
+        filename = basename(path)
+
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+
+        return join(cls.bytecode_cache_dir or default_cache_dir(), '%s-%s.%s.confc' % (filename, digest, tag))
+
+    @classmethod
+    def verify(cls, path, format=None):
         if path is None:
             return []
 
         if not exists(path):
             raise ConfigurationError('Configuration file not found at path %s' % path)
 
-        with open(path) as config_file:
-            name = 'configuration'
-            code = config_file.read()
-            spec = importlib._bootstrap.ModuleSpec(name, None)
-            module = importlib.util.module_from_spec(spec)
+        namespace = cls.__execute(path, format)
 
-            six.exec_(code, module.__dict__)
+        conf = cls(defaults=[])
 
-            conf = cls(defaults=[])
+        for name, value in namespace.items():
+            if name.upper() == name:
+                setattr(conf, name, value)
 
-            for name, value in module.__dict__.items():
-                if name.upper() == name:
-                    setattr(conf, name, value)
+        not_found = []
 
-            not_found = []
+        for key, value in cls.class_defaults.items():
+            if key not in conf.__dict__ and key not in conf._lazy:
+                not_found.append((key, value))
 
-            for key, value in cls.class_defaults.items():
-                if key not in conf.__dict__:
-                    not_found.append((key, value))
+        return not_found
 
-            return not_found
+    @classmethod
+    def verify_file(cls, path, format=None):
+        # unlike verify, reports unknown keys and invalid values as well,
+        # without building a configuration
+        report = {'path': path, 'missing': [], 'unknown': [], 'errors': []}
+
+        try:
+            values = cls._read_file(path, format)[0]
+        except Exception as error:
+            report['errors'].append({'key': None, 'error': '%s: %s' % (error.__class__.__name__, error)})
+            report['valid'] = False
+            return report
+
+        keys = set()
+
+        for name, value in sorted(values.items()):
+            key = cls._canonical(name)
+            keys.add(key)
+
+            if key not in cls.class_defaults:
+                report['unknown'].append(name)
+
+            schema = cls.class_schema.get(key)
+
+            if schema is not None and not isinstance(value, LazyValue):
+                for error in schema.errors(value):
+                    report['errors'].append({'key': name, 'error': error})
+
+        report['missing'] = sorted(key for key in cls.class_defaults if key not in keys)
+        report['valid'] = not report['errors'] and not report['unknown']
+
+        return report
+
+    @classmethod
+    def verify_files(cls, paths, workers=None):
+        if not workers or len(paths) < 2:
+            return [cls.verify_file(path) for path in paths]
+
+        # the class is pickled by reference, so it must be importable, and
+        # workers only see the options and schema it has once imported. When
+        # processes are forked they also see options defined at runtime,
+        # with spawn (the default on macOS and Windows) they do not
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(cls.verify_file, paths, chunksize=max(1, len(paths) // (workers * 4))))
 
     def __init__(self, **kw):
         if 'defaults' in kw:
             self.defaults = kw['defaults']
 
+        self._lazy = {}
         self._items = kw
+        self._files = {}
+        self._sources = []
+        self._remotes = []
+        self._subscribers = []
+        self._load_workers = None
+        self._reload_lock = threading.Lock()
 
         for key, value in kw.items():
             setattr(self, key, value)
 
+        instance = object.__getattribute__(self, '__dict__')
+        instance['_resolved'] = (Config._generation, self.__resolve(instance))
+
     @property
     def items(self):
+        # a read-only view of a merged dict that is kept until the
+        # configuration changes
+        instance = object.__getattribute__(self, '__dict__')
+        merged = instance.get('_merged')
+
+        if merged is None or merged[0] != Config._generation:
+            values = {}
+            upper = []
+
+            for priority, name, layer in self.__layers(instance):
+                if priority >= VALUES_PRIORITY:
+                    upper.append(layer)
+                else:
+                    values.update(layer)
+
+            values.update(instance['_items'])
+
+            for layer in upper:
+                values.update(layer)
+
+            for key, value in values.items():
+                if isinstance(value, LazyValue):
+                    values[key] = value.evaluate()
+
+            merged = instance['_merged'] = (Config._generation, MappingProxyType(values))
+
+        overlay = self.__override()
+
+        if overlay:
+            values = dict(merged[1])
+            aliased_items = type(self).class_aliased_items
+
+            for key in overlay:
+                if key not in aliased_items:
+                    values[key] = getattr(self, key)
+
+            return MappingProxyType(values)
+
+        return merged[1]
+
+    def freeze(self):
+        cls = type(self)
+        instance = object.__getattribute__(self, '__dict__')
+
+        keys = set(cls.class_defaults) | set(cls.class_aliased_items) | set(instance['_lazy'])
+        keys.update(dict(instance.get('defaults', {})))
+        keys.update(instance['_items'])
+
+        for priority, name, layer in instance['_sources']:
+            keys.update(layer)
+        keys.update(key for key in instance if key.upper() == key)
+        keys.update(self.__override() or ())
+        keys.discard('defaults')
+
         values = {}
 
-        for key, value in self.class_defaults.items():
-            values[key] = value
+        for key in keys:
+            if hasattr(cls, key):
+                continue
+
+            try:
+                values[key] = getattr(self, cls._canonical(key))
+            except AttributeError:
+                pass
+
+        frozen = FrozenConfig(values)
+
+        # snapshots taken inside override() are not kept, as they only hold
+        # for the thread or task that took them
+        if not self.__override():
+            instance['_frozen'] = (Config._generation, frozen)
+
+        return frozen
+
+    @property
+    def frozen(self):
+        frozen = object.__getattribute__(self, '__dict__').get('_frozen')
+
+        if frozen is None or frozen[0] != Config._generation or self.__override():
+            return self.freeze()
+
+        return frozen[1]
+
+    @contextlib.contextmanager
+    def override(self, **values):
+        # values layered on top of everything else until the with block ends,
+        # seen only by the thread or asyncio task that entered it
+        overrides = dict(_overrides.get() or {})
+        overlay = dict(overrides.get(self, {}))
+        overlay.update(self._overlay_values(values))
+        overrides[self] = overlay
+
+        token = _overrides.set(overrides)
+
+        with _overriding_lock:
+            _overriding[0] += 1
+
+        try:
+            yield self
+        finally:
+            _overrides.reset(token)
+
+            with _overriding_lock:
+                _overriding[0] -= 1
+
+    def overlay(self, values):
+        return ConfigOverlay(self, self._overlay_values(values))
+
+    def section(self, prefix):
+        return ConfigSection(self, prefix.strip('_'))
+
+    def _section_keys(self, prefix):
+        return self.__sections().get(prefix, {})
 
-        for key, value in self.defaults.items():
-            values[key] = value
+    def __sections(self):
+        # keys by each of their prefixes, in dicts used as ordered sets, built
+        # along with the resolution table and kept up to date when values are set
+        instance = object.__getattribute__(self, '__dict__')
+        resolved = self.__table()
+        sections = instance.get('_sections')
 
-        for key, value in self._items.items():
-            values[key] = value
+        if sections is None or sections[0] is not resolved:
+            aliased_items = type(self).class_aliased_items
+            index = defaultdict(dict)
 
-        return values
+            for key in resolved[1]:
+                if not key.startswith('_') and key != 'defaults' and key not in aliased_items:
+                    for prefix in section_prefixes(key):
+                        index[prefix][key] = None
 
-    def reload(self):
+            sections = instance['_sections'] = (resolved, index)
+
+        return sections[1]
+
+    def _overlay_values(self, values):
+        # aliases are layered along with their key, so reading either is a
+        # single lookup
+        cls = type(self)
+        layered = {}
+
+        for name, value in values.items():
+            if hasattr(cls, name):
+                raise ConfigurationError('%s can not be overridden.' % name)
+
+            key = cls._canonical(name)
+            layered[key] = value
+
+            for alias in cls.class_aliases.get(key, ()):
+                layered[alias] = value
+
+        return layered
+
+    def __override(self):
+        overrides = _overrides.get()
+
+        return overrides.get(self) if overrides else None
+
+    def add_source(self, name, values, priority=SOURCE_PRIORITY):
+        # a source with the same name is replaced, which is also how a source
+        # whose values changed is refreshed
+        instance = object.__getattribute__(self, '__dict__')
+        sources = [source for source in instance['_sources'] if source[1] != name]
+        sources.append((priority, name, values))
+        sources.sort(key=lambda source: source[0])
+
+        self.__set_sources(instance, sources)
+
+    def remove_source(self, name):
+        instance = object.__getattribute__(self, '__dict__')
+        self.__set_sources(instance, [source for source in instance['_sources'] if source[1] != name])
+
+    def get_sources(self):
+        instance = object.__getattribute__(self, '__dict__')
+        sources = [(priority, name) for priority, name, values in self.__layers(instance)]
+        sources.append((VALUES_PRIORITY, 'values'))
+        sources.sort(key=lambda source: source[0])
+
+        return sources
+
+    def source_of(self, name):
+        cls = type(self)
+
+        if name in (self.__override() or ()):
+            return 'override'
+
+        if cls._allow_environment_variables:
+            environment = cls._environment
+
+            if environment is None:
+                if cls._environment_names.get(name, name) in os.environ:
+                    return 'environment'
+            elif name in environment:
+                return 'environment'
+
+        try:
+            return self.__provenance()[cls._canonical(name)]
+        except KeyError:
+            raise KeyError('No config called \'%s\'' % name)
+
+    def __set_sources(self, instance, sources):
+        instance['_sources'] = sources
+        instance['_shadowed'] = frozenset(
+            key for priority, name, values in sources if priority >= VALUES_PRIORITY for key in values
+        )
+        instance['_merged'] = None
+        instance['_frozen'] = None
+        instance['_provenance'] = None
+
+        # rebuilt right away, as sources above the values can shadow what the
+        # instance itself holds
+        instance['_resolved'] = (Config._generation, self.__resolve(instance))
+
+    def __layers(self, instance):
+        layers = [
+            (CLASS_DEFAULTS_PRIORITY, 'class defaults', type(self).class_defaults),
+            (DEFAULTS_PRIORITY, 'defaults', instance.get('defaults', {})),
+        ]
+        layers.extend(instance.get('_sources', ()))
+        layers.sort(key=lambda layer: layer[0])
+
+        return layers
+
+    def __provenance(self):
+        # which layer supplied each key, built on demand and kept until the
+        # configuration changes
+        instance = object.__getattribute__(self, '__dict__')
+        provenance = instance.get('_provenance')
+
+        if provenance is not None and provenance[0] == Config._generation:
+            return provenance[1]
+
+        cls = type(self)
+        index = {}
+        upper = []
+
+        for priority, name, values in self.__layers(instance):
+            if priority >= VALUES_PRIORITY:
+                upper.append((name, values))
+                continue
+
+            for key in dict(values):
+                if not hasattr(cls, key):
+                    index[key] = name
+
+        lazies = instance['_lazy']
+        missing = object()
+        files = instance['_files']
+
+        for path in sorted(files):
+            for key, value in files[path]['values'].items():
+                if lazies.get(key, instance.get(key, missing)) is value:
+                    index[key] = path
+
+        for key in list(instance) + list(lazies):
+            if not key.startswith('_') and key != 'defaults' and index.get(key) not in files:
+                index[key] = 'values'
+
+        for name, values in upper:
+            for key in values:
+                if not hasattr(cls, key):
+                    index[key] = name
+
+        instance['_provenance'] = (Config._generation, index)
+
+        return index
+
+    def reload(self, force=False):
+        with self._reload_lock:
+            paths, changed, seen = self.__collect(force)
+            return self.__commit(paths, changed)
+
+    async def areload(self, force=False):
+        # files are read and compiled in the default executor, the new values
+        # are swapped in on the event loop thread
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        paths, changed, seen = await loop.run_in_executor(None, self.__collect, force)
+
+        # while another thread reloads, the lock is waited for in the
+        # executor rather than on the event loop
+        lock = self._reload_lock
+
+        if not lock.acquire(blocking=False):
+            acquiring = loop.run_in_executor(None, lock.acquire)
+
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                acquiring.add_done_callback(lambda future: lock.release())
+                raise
+
+        try:
+            # a reload that committed while the files were read already has
+            # newer states than the ones collected here, which are dropped
+            files = self._files
+            changed = dict((path, state) for path, state in changed.items() if files.get(path) is seen.get(path))
+
+            return self.__commit(paths, changed, seen)
+        finally:
+            lock.release()
+
+    @classmethod
+    async def aload(cls, path, **kw):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(None, functools.partial(cls.load, path, **kw))
+
+    async def changes(self):
+        # yields the diff of every reload that changed something, however
+        # the reload was started
+        import asyncio
+
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        self._subscribers.append(subscriber)
+
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.remove(subscriber)
+
+    def watch(self, **kw):
+        from derpconf.watcher import ConfigWatcher
+
+        watcher = ConfigWatcher(self, **kw)
+        watcher.start()
+
+        return watcher
+
+    @classmethod
+    def profile(cls):
+        from derpconf.profiling import ConfigProfiler
+
+        return ConfigProfiler(cls).start()
+
+    def __collect(self, force):
+        # reads the files that changed, without touching the configuration
+        cls = type(self)
+        folder = getattr(self, 'config_folder', None)
         cfg = getattr(self, 'config_file', None)
+        remotes = self._remotes
+
+        if folder is not None:
+            paths = cls.get_folder_files(folder)
+        elif cfg is not None:
+            paths = [cfg]
+        elif remotes:
+            paths = []
+        else:
+            return None, {}, {}
 
-        if cfg is None:
-            return
+        files = self._files
+        seen = dict(files)
+        changed = {}
+        reads = []
+
+        # states are never changed in place, as the committed ones are still
+        # read; files touched without changing get a new state with the same
+        # values, and are not read again unless forced
+        for path in paths:
+            previous = seen.get(path)
+            state = cls.__file_state(path, previous)
+
+            if previous is not None and state['values'] is previous['values']:
+                if not force:
+                    if state is not previous:
+                        changed[path] = state
+                    continue
+
+                state = dict(state, values={})
+
+            changed[path] = state
+            reads.append(path)
+
+        results = cls.__read_files([(path, changed[path]['format']) for path in reads], self._load_workers)
+
+        for path, (values, timings) in zip(reads, results):
+            state = changed[path]
+            state['timings'] = timings
+            strings = loaders.is_string_format(path, state['format'])
+
+            for name, value in values.items():
+                key = cls._canonical(name)
+                state['values'][key] = cls._coerce_loaded(key, value, strings)
+
+        # remote sources answer whether they changed themselves, usually
+        # with a conditional request
+        for source in remotes:
+            previous = seen.get(source.name)
+            state = source.load(previous, force)
+
+            if state is not previous:
+                changed[source.name] = cls.__remote_state(state)
+
+        return [source.name for source in remotes] + paths, changed, seen
+
+    def __commit(self, paths, changed, seen=None):
+        if paths is None:
+            return {}
+
+        files = self._files
+        affected = set()
+
+        # only the files known when collecting are removed, not the ones a
+        # newer reload added since
+        for path in set(files if seen is None else seen).intersection(files) - set(paths):
+            affected.update(files.pop(path)['values'])
+
+        for path, state in changed.items():
+            previous = files.get(path)
+
+            if previous is not None:
+                # files touched without changing keep their values
+                if state['values'] is previous['values']:
+                    continue
+
+                affected.update(previous['values'])
+            affected.update(state['values'])
+
+        if not affected:
+            files.update(changed)
+            return {}
+
+        old = dict((key, self.__peek(key)) for key in affected)
+        files.update(changed)
+
+        updates = {}
+        removals = set()
+
+        for key in affected:
+            providers = [files[path]['values'] for path in paths if path in files and key in files[path]['values']]
+
+            if providers:
+                updates[key] = providers[-1][key]
+            else:
+                removals.add(key)
+
+        remotes = set(source.name for source in self._remotes)
+        local = [path for path in paths if path not in remotes]
+
+        if local:
+            updates['config_file'] = local[-1]
+
+        self.__apply(updates, removals)
+
+        diff = {}
+
+        for key in affected:
+            new = self.__peek(key)
 
-        self.__load_from_path(self, cfg)
+            if new is not old[key] and new != old[key]:
+                diff[key] = (old[key], new)
+
+        if diff:
+            # readers holding the previous snapshot keep it, new readers get
+            # the reloaded one
+            if object.__getattribute__(self, '__dict__').get('_frozen') is not None:
+                self.freeze()
+
+            for loop, queue in list(self._subscribers):
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, diff)
+                except RuntimeError:
+                    # the subscriber's loop is closed
+                    pass
+
+        return diff
+
+    def __apply(self, updates, removals):
+        # readers look values up in the resolution table first, so building
+        # the new table aside and swapping it in makes the whole change
+        # visible at once
+        instance = object.__getattribute__(self, '__dict__')
+        lazies = dict(instance['_lazy'])
+        values = {}
+
+        for key, value in updates.items():
+            if isinstance(value, LazyValue):
+                lazies[key] = value
+            else:
+                lazies.pop(key, None)
+                values[key] = value
+
+        for key in removals:
+            lazies.pop(key, None)
+
+        stale = removals | (set(updates) - set(values))
+        merged = dict(instance)
+        merged.update(values)
+        merged['_lazy'] = lazies
+
+        for key in stale:
+            merged.pop(key, None)
+
+        instance['_resolved'] = (Config._generation, self.__resolve(merged))
+        instance['_lazy'] = lazies
+        instance.update(values)
+
+        for key in stale:
+            instance.pop(key, None)
+
+        for key in removals:
+            instance['_items'].pop(key, None)
+
+        for key, value in updates.items():
+            if key.upper() == key:
+                instance['_items'][key] = value
+
+        instance['_merged'] = None
+        instance['_provenance'] = None
 
     def validates_presence_of(self, *args):
-        for arg in args:
-            if not hasattr(self, arg):
-                raise ConfigurationError('Configuration %s was not found and does not have a default value. Please verify your thumbor.conf file' % arg)
+        missing = [arg for arg in args if not hasattr(self, arg)]
+
+        if missing:
+            raise ConfigurationError('Configuration %s was not found and does not have a default value. Please verify your thumbor.conf file' % ', '.join(missing))
+
+    def get_validation_errors(self):
+        errors = []
+
+        for key, schema in type(self).class_schema.items():
+            if not hasattr(self, key):
+                continue
+
+            for error in schema.errors(getattr(self, key)):
+                errors.append((key, error))
+
+        return errors
+
+    def validate(self):
+        errors = self.get_validation_errors()
+
+        if errors:
+            raise ValidationError(errors)
 
     def get(self, name, default=None):
         if hasattr(self, name):
@@ -186,44 +1577,178 @@ class Config(object):
             return self.class_descriptions.get(name, None)
         raise KeyError('No config called \'%s\'' % name)
 
+    def get_load_times(self):
+        return dict((path, state['timings']['total']) for path, state in self._files.items())
+
+    def get_load_timings(self):
+        return dict((path, dict(state['timings'])) for path, state in self._files.items())
+
     def __setattr__(self, name, value):
-        if name in self.__class__.class_aliased_items:
-            logging.warn('Option %s is marked as deprecated please use %s instead.' % (name,
-                self.__class__.class_aliased_items[name]))
-            self.__setattr__(self.__class__.class_aliased_items[name], value)
+        aliased_items = type(self).class_aliased_items
+
+        if name in aliased_items:
+            warn_deprecated(name, aliased_items[name])
+            self.__setattr__(aliased_items[name], value)
         else:
-            super(Config, self).__setattr__(name, value)
+            instance = object.__getattribute__(self, '__dict__')
+            lazies = instance.get('_lazy')
+
+            # lazy values are kept aside until they are read, so that the
+            # regular attribute lookup never returns the wrapper itself
+            if isinstance(value, LazyValue):
+                instance.pop(name, None)
+                lazies[name] = value
+            else:
+                super(Config, self).__setattr__(name, value)
+
+                if lazies:
+                    lazies.pop(name, None)
+
+            if instance.get('_frozen') is not None:
+                instance['_frozen'] = None
+
+            if instance.get('_merged') is not None:
+                instance['_merged'] = None
+
+            if instance.get('_provenance') is not None:
+                instance['_provenance'] = None
+
+            resolved = instance.get('_resolved')
+
+            if resolved is not None:
+                if name == 'defaults':
+                    instance['_resolved'] = None
+                elif name not in instance.get('_shadowed', ()):
+                    sections = instance.get('_sections')
+
+                    if sections is not None and sections[0] is resolved and name not in resolved[1]:
+                        for prefix in section_prefixes(name):
+                            sections[1][prefix][name] = None
+
+                    # instance values always take precedence, so the
+                    # table can be kept up to date in place
+                    resolved[1][name] = value
+
+                    for alias in type(self).class_aliases.get(name, ()):
+                        if alias in resolved[1]:
+                            resolved[1][alias] = value
 
     def __getattribute__(self, name):
-        if name in ['_allow_environment_variables']:
-            return super(Config, self).__getattribute__(name)
+        if _overriding[0]:
+            overrides = _overrides.get() or {}
+            overlay = overrides.get(self)
 
-        if self._allow_environment_variables:
-            value = os.environ.get(name, None)
+            if overlay is not None and name in overlay:
+                value = overlay[name]
+
+                if value.__class__ is LazyValue:
+                    value = overlay[name] = value.evaluate()
 
-            if value is not None:
                 return value
 
-        return super(Config, self).__getattribute__(name)
+        cls = type(self)
+
+        if cls._allow_environment_variables and name != '__dict__':
+            environment = cls._environment
+
+            if environment is None:
+                value = os.environ.get(cls._environment_names.get(name, name), None)
+
+                if value is not None:
+                    return value
+            elif name in environment:
+                return environment[name]
+
+        instance = object.__getattribute__(self, '__dict__')
+        resolved = instance.get('_resolved')
+
+        # a missing or stale table is rebuilt rather than skipped, since the
+        # instance attributes alone ignore sources and defaults; internal
+        # names, and lookups made while the instance is being built, do not
+        # need it
+        if (resolved is None or resolved[0] != Config._generation) and '_resolved' in instance and name[:1] != '_':
+            resolved = self.__table()
+
+        if resolved is not None and resolved[0] == Config._generation and name in resolved[1]:
+            value = resolved[1][name]
+
+            if value.__class__ is LazyValue:
+                value = resolved[1][name] = value.evaluate()
+
+            return value
+
+        return object.__getattribute__(self, name)
 
     def __getattr__(self, name):
-        if name in self.__dict__:
-            return self.__dict__[name]
+        cls = type(self)
+        resolved = self.__table()
 
-        if name in self.__class__.class_aliased_items:
-            logging.warn('Option %s is marked as deprecated please use %s instead.' % (name,
-                self.__class__.class_aliased_items[name]))
+        key = cls.class_aliased_items.get(name, name)
 
-            return self.__getattr__(self.__class__.class_aliased_items[name])
+        if key in resolved[1]:
+            value = resolved[1][key]
 
-        if 'defaults' in self.__dict__ and name in self.__dict__['defaults']:
-            return self.__dict__['defaults'][name]
+            if value.__class__ is LazyValue:
+                value = resolved[1][key] = value.evaluate()
 
-        if name in self.__class__.class_defaults:
-            return self.__class__.class_defaults[name]
+            if key != name:
+                warn_deprecated(name, key)
+
+                # later reads of the alias are table hits, just like reads
+                # of the key itself
+                resolved[1][name] = value
+
+            return value
 
         raise AttributeError(name)
 
+    def __table(self):
+        instance = object.__getattribute__(self, '__dict__')
+        resolved = instance.get('_resolved')
+
+        if resolved is None or resolved[0] != Config._generation:
+            resolved = instance['_resolved'] = (Config._generation, self.__resolve(instance))
+
+        return resolved
+
+    def __peek(self, name):
+        # returns the loaded value of a key without evaluating lazy values
+        return self.__table()[1].get(type(self)._canonical(name), None)
+
+    def __resolve(self, instance):
+        # layers are applied from the lowest priority up; class attributes
+        # (methods, properties) still win over defaults and sources, so those
+        # are left for the regular lookup. Defaults are copied in, so changing
+        # them in place is only seen after invalidate()
+        cls = type(self)
+        resolved = {}
+        upper = []
+
+        for priority, name, values in self.__layers(instance):
+            if priority >= VALUES_PRIORITY:
+                upper.append(values)
+                continue
+
+            for key, value in dict(values).items():
+                if not hasattr(cls, key):
+                    resolved[key] = value
+
+        resolved.update(instance)
+        resolved.update(instance.get('_lazy', {}))
+
+        for values in upper:
+            for key, value in dict(values).items():
+                if not hasattr(cls, key):
+                    resolved[key] = value
+
+        resolved.pop('_resolved', None)
+        resolved.pop('_frozen', None)
+        resolved.pop('_merged', None)
+        resolved.pop('_provenance', None)
+        resolved.pop('_sections', None)
+
+        return resolved
+
     def __getitem__(self, name):
         if hasattr(self, name):
             return getattr(self, name)
@@ -234,7 +1759,33 @@ class Config(object):
 
     @classmethod
     def get_config_text(cls):
-        result = []
+        # kept until define() or alias() change the options
+        cached = cls.__dict__.get('_config_text')
+
+        if cached is None or cached[0] != Config._generation:
+            cached = (Config._generation, '\n'.join(cls.iter_config_text()))
+            cls._config_text = cached
+
+        return cached[1]
+
+    @classmethod
+    def write_config_text(cls, output):
+        lines = cls.iter_config_text()
+
+        for line in lines:
+            output.write(line)
+            break
+
+        for line in lines:
+            output.write('\n')
+            output.write(line)
+
+    @classmethod
+    def iter_config_text(cls):
+        # only needed to write configuration examples, so imported here
+        from textwrap import fill
+        from derpconf.formatting import format_value
+
         MAX_LEN = 80
         SEPARATOR = '#'
 
@@ -245,27 +1796,53 @@ class Config(object):
 
             if len(group_name) < MAX_LEN:
                 group_name += SEPARATOR
-            result.append(group_name)
+            yield group_name
 
             for key in keys:
-                result.append('')
-                value = cls.class_defaults[key]
+                yield ''
+                value = format_value(cls.class_defaults[key])
                 description = cls.class_descriptions[key]
 
                 wrapped = fill(description, width=78, subsequent_indent='## ')
 
-                result.append('## %s' % wrapped)
+                yield '## %s' % wrapped
 
                 if key in cls.class_aliases:
-                    result.append('## Aliases: %s' % ', '.join(cls.class_aliases[key]))
-                result.append('## Defaults to: %s' % format_value(value))
-                result.append('#%s = %s' % (key, format_value(value)))
-            result.append('')
-            result.append(SEPARATOR * MAX_LEN)
-            result.append('')
-            result.append('')
+                    yield '## Aliases: %s' % ', '.join(cls.class_aliases[key])
+                yield '## Defaults to: %s' % value
+                yield '#%s = %s' % (key, value)
+            yield ''
+            yield SEPARATOR * MAX_LEN
+            yield ''
+            yield ''
+
+
+REGISTRIES = ('class_defaults', 'class_group_items', 'class_groups', 'class_descriptions',
+              'class_aliases', 'class_aliased_items', 'class_schema')
+
+
+def copy_registry(registry):
+    if isinstance(registry, defaultdict):
+        return defaultdict(registry.default_factory, ((key, list(value)) for key, value in registry.items()))
+
+    return type(registry)(registry)
+
+
+def default_cache_dir():
+    return join(os.environ.get('XDG_CACHE_HOME') or join(os.path.expanduser('~'), '.cache'), 'derpconf')
+
 
-        return '\n'.join(result)
+_deprecation_warnings = set()
+
+
+def warn_deprecated(alias, key):
+    # once per alias and process, so legacy reads on a hot path do not
+    # flood the logs
+    if alias in _deprecation_warnings:
+        return
+
+    _deprecation_warnings.add(alias)
+    logging.warning('Option %s is marked as deprecated please use %s instead.' % (alias, key))
 
 
 def verify_config(path=None):
@@ -283,42 +1860,193 @@ def verify_config(path=None):
         sys.stdout.write('Configuration "{0}{1}{2}" not found in file {3}. Using "{4}{5}{2}" instead.\n'.format(OKBLUE, error[0], ENDC, path, OKGREEN, error[1]))
 
 
+def verify_configs(args=None, config_class=None, output=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Verifies many configuration files at once.')
+    parser.add_argument('paths', nargs='+', help='configuration files, folders or glob patterns')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--json', action='store_true', help='writes the report as JSON')
+    options = parser.parse_args(args)
+
+    config_class = config_class or Config
+    output = output or sys.stdout
+    paths = []
+
+    for pattern in options.paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if isdir(path):
+                paths.extend(config_class.get_folder_files(path))
+            else:
+                paths.append(path)
+
+    reports = config_class.verify_files(paths, options.workers)
+
+    if options.json:
+        json.dump(reports, output, indent=2, sort_keys=True)
+        output.write('\n')
+    else:
+        for report in reports:
+            output.write('%s: %s\n' % (report['path'], 'ok' if report['valid'] else 'invalid'))
+
+            for error in report['errors']:
+                output.write('  %s\n' % (error['error'] if error['key'] is None else '%s: %s' % (error['key'], error['error'])))
+            for key in report['unknown']:
+                output.write('  %s: unknown key\n' % key)
+            for key in report['missing']:
+                output.write('  %s: not set, using the default value\n' % key)
+
+    return 0 if all(report['valid'] for report in reports) else 1
+
+
 def generate_config():
-    sys.stdout.write("%s\n" % Config.get_config_text())
+    Config.write_config_text(sys.stdout)
+    sys.stdout.write("\n")
 
-spaces = ' ' * 4
 
+def coerce_value(value, default):
+    if default is None or isinstance(default, str):
+        return value
 
-def format_tuple(value, tabs=0):
-    separator = spaces * (tabs + 0)
-    item_separator = spaces * (tabs + 1)
-    start_delimiter = isinstance(value, tuple) and '(' or '['
-    end_delimiter = isinstance(value, tuple) and ')' or ']'
+    if isinstance(default, bool):
+        lowered = value.strip().lower()
 
-    representation = ''
+        if lowered in ('1', 'true', 'yes', 'on'):
+            return True
+        if lowered in ('0', 'false', 'no', 'off', ''):
+            return False
+        raise ValueError(value)
 
-    if tabs != 0:
-        representation += '#'
-    representation += "%s%s\n" % (separator, start_delimiter)
+    if isinstance(default, (int, float)):
+        return type(default)(value)
 
-    for item in value:
-        if isinstance(item, (tuple, list, set)):
-            representation += format_tuple(item, tabs + 1)
-        else:
-            representation += '#%s' % item_separator + format_value(item) + ",\n"
-    representation += "#%s%s%s\n" % (separator, end_delimiter, (tabs > 0 and ',' or ''))
+    if isinstance(default, (tuple, list, set, dict)):
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            if isinstance(default, dict):
+                raise
+            parsed = [item.strip() for item in value.split(',') if item.strip()]
+
+        if isinstance(parsed, str):
+            parsed = [parsed]
+
+        return type(default)(parsed)
+
+    return value
+
+
+CACHED_CODE = b'C'
+CACHED_VALUES = b'V'
+
+LINE_BREAKS = re.compile('[\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]|\r(?!\n)')
+
+LITERAL_LINE = re.compile(r'''
+    ^(?P<name>[A-Za-z_][A-Za-z0-9_]*)\s*=\s*
+    (?:
+        '(?P<single>[^'\\]*)' |
+        "(?P<double>[^"\\]*)" |
+        (?P<float>[-+]?(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?) |
+        (?P<int>[-+]?(?:0|[1-9]\d*)) |
+        (?P<constant>True|False|None)
+    )
+    \s*(?:\#.*)?$
+''', re.VERBOSE)
+
+CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+
+def parse_literal_config(source):
+    # simple assignments are read line by line with a regular expression;
+    # anything else is parsed with ast, and None is returned if the file
+    # does more than assign literals to names
+    values = {}
+
+    # str.splitlines() also breaks lines where Python does not, so sources
+    # with any such character are left to ast
+    if LINE_BREAKS.search(source):
+        return parse_literal_ast(source)
+
+    for line in source.split('\n'):
+        match = LITERAL_LINE.match(line.rstrip())
+
+        if match is None:
+            if not line or line.isspace() or line.lstrip().startswith('#'):
+                continue
+            return parse_literal_ast(source)
+
+        kind = match.lastgroup
+        value = match.group(kind)
+
+        if kind == 'int':
+            value = int(value)
+        elif kind == 'float':
+            value = float(value)
+        elif kind == 'constant':
+            value = CONSTANTS[value]
+
+        values[match.group('name')] = value
+
+    return values
+
+
+def parse_literal_ast(source):
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+
+    values = {}
+
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+            return None
+
+        try:
+            values[node.targets[0].id] = ast.literal_eval(node.value)
+        except ValueError:
+            return None
+
+    return values
+
+
+def type_name(type_):
+    if isinstance(type_, tuple):
+        return ' or '.join(item.__name__ for item in type_)
+    return type_.__name__
+
+
+def coerce_to_type(value, type_):
+    if isinstance(value, type_):
+        return value
+
+    types = type_ if isinstance(type_, tuple) else (type_,)
+
+    for target in types:
+        try:
+            if isinstance(value, str):
+                return coerce_value(value, target())
+
+            if target in (tuple, list, set, frozenset) and isinstance(value, (tuple, list, set, frozenset)):
+                return target(value)
+
+            if target is float and isinstance(value, int) and not isinstance(value, bool):
+                return float(value)
+        except (TypeError, ValueError, SyntaxError):
+            continue
 
-    return representation
+    raise ValueError('%r is not a %s' % (value, type_name(type_)))
 
 
-def format_value(value):
-    if isinstance(value, six.string_types):
-        return "'%s'" % value
+def __getattr__(name):
+    # the helpers that format values for configuration examples live in
+    # derpconf.formatting, which is imported on first use
+    if name in ('spaces', 'format_tuple', 'write_tuple', 'format_value'):
+        from derpconf import formatting
+        return getattr(formatting, name)
 
-    if isinstance(value, (tuple, list, set)):
-        return format_tuple(value)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-    return str(value)
 
 if __name__ == '__main__':
     Config.define('foo', 'fooval', 'Foo is always a foo', 'FooValues')
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+# Helpers that write default values into configuration examples. Only
+# Config.iter_config_text needs them, and it imports this module when first
+# called.
+
+spaces = ' ' * 4
+
+
+def format_tuple(value, tabs=0):
+    # nested values are written into a single list of pieces, so formatting
+    # takes linear time however deep they go
+    pieces = []
+    write_tuple(pieces, value, tabs)
+
+    return ''.join(pieces)
+
+
+def write_tuple(pieces, value, tabs):
+    separator = spaces * (tabs + 0)
+    item_separator = spaces * (tabs + 1)
+    start_delimiter = isinstance(value, tuple) and '(' or '['
+    end_delimiter = isinstance(value, tuple) and ')' or ']'
+
+    if tabs != 0:
+        pieces.append('#')
+    pieces.append("%s%s\n" % (separator, start_delimiter))
+
+    for item in value:
+        if isinstance(item, (tuple, list, set)):
+            write_tuple(pieces, item, tabs + 1)
+        else:
+            pieces.append('#%s%s,\n' % (item_separator, format_value(item)))
+    pieces.append("#%s%s%s\n" % (separator, end_delimiter, (tabs > 0 and ',' or '')))
+
+
+def format_value(value):
+    if isinstance(value, str):
+        return "'%s'" % value
+
+    if isinstance(value, (tuple, list, set)):
+        return format_tuple(value)
+
+    return str(value)
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import json
+from os.path import basename, splitext
+
+# Loaders read a configuration file in some format and return a dict of its
+# values. Python configuration files (.conf) are not handled here, they are
+# executed (or parsed) by Config itself.
+
+LOADERS = {}
+EXTENSIONS = {}
+
+# formats whose values are all strings, which Config converts to the type of
+# each option's default
+STRING_FORMATS = set()
+
+
+def register_loader(name, function, extensions=(), strings=False):
+    LOADERS[name] = function
+
+    if strings:
+        STRING_FORMATS.add(name)
+    else:
+        STRING_FORMATS.discard(name)
+
+    for extension in extensions:
+        EXTENSIONS[extension.lower()] = name
+
+
+def get_format(path, format=None):
+    if format is not None:
+        if format != 'python' and format not in LOADERS:
+            raise ValueError('Unknown configuration format %s.' % format)
+        return format
+
+    return EXTENSIONS.get(get_extension(path), 'python')
+
+
+def get_extension(path):
+    name = basename(path)
+    extension = splitext(name)[1]
+
+    # dotfiles such as .env have no extension as far as splitext is concerned
+    if not extension and name.startswith('.'):
+        extension = name
+
+    return extension.lower()
+
+
+def is_string_format(path, format=None):
+    return get_format(path, format) in STRING_FORMATS
+
+
+def is_configuration_file(filename):
+    extension = get_extension(filename)
+    return extension == '.conf' or extension in EXTENSIONS
+
+
+def load_json(path):
+    with open(path) as config_file:
+        values = json.load(config_file)
+
+    if not isinstance(values, dict):
+        raise ValueError('JSON configuration %s must be an object.' % path)
+
+    return values
+
+
+def load_toml(path):
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ImportError('Loading TOML configuration files requires Python 3.11 or the tomli package.')
+
+    with open(path, 'rb') as config_file:
+        return tomllib.load(config_file)
+
+
+def load_yaml(path):
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError('Loading YAML configuration files requires the PyYAML package.')
+
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+    with open(path) as config_file:
+        values = yaml.load(config_file, Loader=loader)
+
+    if values is None:
+        return {}
+
+    if not isinstance(values, dict):
+        raise ValueError('YAML configuration %s must be a mapping.' % path)
+
+    return values
+
+
+def load_ini(path):
+    # options of the DEFAULT section keep their names, options of any other
+    # section are prefixed with it: [storage] bucket = x becomes STORAGE_BUCKET
+    from configparser import RawConfigParser
+
+    # DEFAULT is read as a section like any other, so sections only hold the
+    # options they set themselves, including those that override DEFAULT
+    default_section = 'DEFAULT'
+    parser = RawConfigParser(default_section='\0')
+    parser.optionxform = str
+
+    with open(path) as config_file:
+        parser.read_file(config_file)
+
+    values = {}
+
+    for section in parser.sections():
+        for key in parser.options(section):
+            name = key if section == default_section else '%s_%s' % (section, key)
+            values[name.upper()] = parser.get(section, key)
+
+    return values
+
+
+def load_env(path):
+    values = {}
+
+    with open(path) as config_file:
+        for line in config_file:
+            line = line.strip()
+
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+
+            key, value = line.split('=', 1)
+            key = key.strip()
+
+            if key.startswith('export '):
+                key = key[len('export '):].strip()
+
+            value = value.strip()
+
+            if len(value) > 1 and value[0] == value[-1] and value[0] in ('"', "'"):
+                value = value[1:-1]
+            elif ' #' in value:
+                value = value.split(' #', 1)[0].rstrip()
+
+            values[key] = value
+
+    return values
+
+
+register_loader('json', load_json, ('.json',))
+register_loader('toml', load_toml, ('.toml',))
+register_loader('yaml', load_yaml, ('.yaml', '.yml'))
+register_loader('ini', load_ini, ('.ini',), strings=True)
+register_loader('env', load_env, ('.env',), strings=True)
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import os
+from collections import defaultdict
+
+# The profiler wraps the lookup methods of a configuration class while it is
+# running and puts the originals back when stopped, so classes that are not
+# being profiled pay nothing for it.
+
+PHASES = ('read', 'compile', 'exec', 'total')
+
+
+def find_attribute(cls, name):
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass.__dict__[name]
+
+    raise AttributeError(name)
+
+
+def from_environment(config_class, name):
+    if not config_class._allow_environment_variables:
+        return False
+
+    environment = config_class._environment
+
+    if environment is not None:
+        return name in environment
+
+    return config_class._environment_names.get(name, name) in os.environ
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ConfigProfiler(object):
+    def __init__(self, config_class):
+        self.config_class = config_class
+        self.reads = defaultdict(int)
+        self.aliases = defaultdict(int)
+        self.environment = defaultdict(int)
+        self.files = {}
+        self._originals = None
+
+    @property
+    def running(self):
+        return self._originals is not None
+
+    def start(self):
+        if self.running:
+            return self
+
+        cls = self.config_class
+        names = ('__getattribute__', '__getattr__', '_read_file')
+        self._originals = dict((name, cls.__dict__.get(name)) for name in names)
+
+        getattribute = find_attribute(cls, '__getattribute__')
+        getattr_ = find_attribute(cls, '__getattr__')
+        read_file = find_attribute(cls, '_read_file').__func__
+
+        reads = self.reads
+        aliases = self.aliases
+        environment = self.environment
+        files = self.files
+
+        def record(config_class, name):
+            reads[name] += 1
+
+            if name in config_class.class_aliased_items:
+                aliases[name] += 1
+
+            if from_environment(config_class, name):
+                environment[name] += 1
+
+        def __getattribute__(instance, name):
+            value = getattribute(instance, name)
+
+            if name.upper() == name and not name.startswith('_'):
+                record(type(instance), name)
+
+            return value
+
+        def __getattr__(instance, name):
+            value = getattr_(instance, name)
+            record(type(instance), name)
+
+            return value
+
+        def _read_file(config_class, path, format=None):
+            values, timings = read_file(config_class, path, format)
+            files[path] = dict(timings)
+
+            return values, timings
+
+        cls.__getattribute__ = __getattribute__
+        cls.__getattr__ = __getattr__
+        cls._read_file = classmethod(_read_file)
+
+        return self
+
+    def stop(self):
+        if not self.running:
+            return self
+
+        for name, original in self._originals.items():
+            if original is None:
+                delattr(self.config_class, name)
+            else:
+                setattr(self.config_class, name, original)
+
+        self._originals = None
+
+        return self
+
+    def reset(self):
+        self.reads.clear()
+        self.aliases.clear()
+        self.environment.clear()
+        self.files.clear()
+
+    def hot_keys(self, count=10):
+        return sorted(self.reads.items(), key=lambda item: (-item[1], item[0]))[:count]
+
+    def slow_files(self, count=10):
+        return sorted(self.files.items(), key=lambda item: (-item[1]['total'], item[0]))[:count]
+
+    def as_dict(self):
+        return {
+            'files': dict((path, dict(timings)) for path, timings in self.files.items()),
+            'reads': dict(self.reads),
+            'aliases': dict(self.aliases),
+            'environment': dict(self.environment),
+        }
+
+    def to_prometheus(self):
+        lines = [
+            '# HELP derpconf_file_load_seconds Seconds spent loading a configuration file, by phase.',
+            '# TYPE derpconf_file_load_seconds gauge',
+        ]
+
+        for path, timings in sorted(self.files.items()):
+            for phase in PHASES:
+                lines.append('derpconf_file_load_seconds{path="%s",phase="%s"} %.9f' % (
+                    escape_label(path), phase, timings.get(phase, 0.0)
+                ))
+
+        aliased_items = self.config_class.class_aliased_items
+        counters = (
+            ('derpconf_key_reads_total', 'Configuration key reads.', self.reads, 'key'),
+            ('derpconf_alias_resolutions_total', 'Reads of deprecated aliases.', self.aliases, 'alias'),
+            ('derpconf_environment_hits_total', 'Reads served by environment variables.', self.environment, 'key'),
+        )
+
+        for metric, description, counts, label in counters:
+            lines.append('# HELP %s %s' % (metric, description))
+            lines.append('# TYPE %s counter' % metric)
+
+            for key, count in sorted(counts.items()):
+                labels = '%s="%s"' % (label, escape_label(key))
+
+                if label == 'alias':
+                    labels += ',key="%s"' % escape_label(aliased_items.get(key, ''))
+
+                lines.append('%s{%s} %d' % (metric, labels, count))
+
+        return '\n'.join(lines) + '\n'
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
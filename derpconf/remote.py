@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import os
+import json
+import time
+import logging
+from http.client import HTTPException
+from os.path import dirname, isdir
+
+from derpconf.config import ConfigurationError
+
+# A remote source fetches configuration values from somewhere other than the
+# local disk, such as an HTTP server or a key-value store. Config.load reads
+# it along with its files and reload() revalidates it, so only the keys that
+# changed remotely are applied.
+#
+# Sources hand back a validator (an ETag) with their values and get it again
+# on the next fetch, so they can answer "not modified" instead of sending
+# everything again. The last values fetched are kept on disk, when given a
+# cache_path, and used when the source can not be reached.
+
+FETCH_ERRORS = (OSError, ValueError, HTTPException, ConfigurationError)
+
+
+class RemoteSource(object):
+    def __init__(self, name, cache_path=None):
+        self.name = name
+        self.cache_path = cache_path
+
+    def fetch(self, etag=None):
+        # returns (values, etag), or None if the values did not change since
+        # etag; raises OSError, ValueError, HTTPException or
+        # ConfigurationError on failure
+        raise NotImplementedError()
+
+    def load(self, previous=None, force=False):
+        # returns the state of the source, which is previous itself when
+        # nothing changed
+        cached = None
+        etag = None
+
+        if previous is not None:
+            etag = previous['etag']
+        else:
+            cached = self.read_cache()
+
+            if cached is not None:
+                etag = cached['etag']
+
+        started = time.perf_counter()
+
+        try:
+            result = self.fetch(None if force else etag)
+
+            # a payload that is not a dict of values is treated like a failed
+            # fetch, so the current or cached values are kept
+            if result is not None and not isinstance(result[0], dict):
+                raise ConfigurationError('Configuration from %s must be a dict of values.' % self.name)
+        except FETCH_ERRORS as error:
+            if previous is not None:
+                logging.warning('Could not fetch configuration from %s, keeping the current values: %s' % (
+                    self.name, error
+                ))
+                return previous
+
+            if cached is None:
+                raise ConfigurationError('Could not fetch configuration from %s: %s' % (self.name, error))
+
+            logging.warning('Could not fetch configuration from %s, using the copy cached in %s: %s' % (
+                self.name, self.cache_path, error
+            ))
+            return self.state(cached['values'], cached['etag'], time.perf_counter() - started)
+
+        if result is None:
+            if previous is not None:
+                return previous
+
+            if cached is None:
+                raise ConfigurationError('%s answered not modified, but nothing was fetched from it yet.' % self.name)
+
+            return self.state(cached['values'], cached['etag'], time.perf_counter() - started)
+
+        values, etag = result
+        self.write_cache(values, etag)
+
+        return self.state(values, etag, time.perf_counter() - started)
+
+    def state(self, values, etag, elapsed):
+        return {
+            'etag': etag,
+            'values': dict(values),
+            'format': None,
+            'timings': {'read': elapsed, 'compile': 0.0, 'exec': 0.0, 'total': elapsed},
+        }
+
+    def read_cache(self):
+        if self.cache_path is None:
+            return None
+
+        try:
+            with open(self.cache_path) as cache_file:
+                cached = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(cached, dict) or cached.get('name') != self.name or not isinstance(cached.get('values'), dict):
+            return None
+
+        return cached
+
+    def write_cache(self, values, etag):
+        if self.cache_path is None:
+            return
+
+        # written to a temporary file and renamed, so a crash never leaves a
+        # half written last known good copy
+        temp_path = '%s.%d.tmp' % (self.cache_path, os.getpid())
+
+        try:
+            cache_dir = dirname(self.cache_path)
+            if cache_dir and not isdir(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+
+            with open(temp_path, 'w') as cache_file:
+                json.dump({'name': self.name, 'etag': etag, 'values': values}, cache_file)
+
+            os.replace(temp_path, self.cache_path)
+        except (OSError, TypeError, ValueError) as error:
+            logging.warning('Could not cache configuration from %s in %s: %s' % (self.name, self.cache_path, error))
+
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.name)
+
+
+class HTTPSource(RemoteSource):
+    # reads a JSON object from url, revalidated with If-None-Match
+    def __init__(self, url, cache_path=None, timeout=10, headers=None, parse=json.loads):
+        super(HTTPSource, self).__init__(url, cache_path)
+        self.url = url
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.parse = parse
+
+    def fetch(self, etag=None):
+        from urllib.request import Request, urlopen
+        from urllib.error import HTTPError
+
+        headers = dict(self.headers)
+
+        if etag is not None:
+            headers['If-None-Match'] = etag
+
+        try:
+            with urlopen(Request(self.url, headers=headers), timeout=self.timeout) as response:
+                body = response.read()
+                etag = response.headers.get('ETag')
+        except HTTPError as error:
+            if error.code == 304:
+                return None
+            raise
+
+        return self.parse(body.decode('utf-8')), etag
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import os
+import mmap
+import pickle
+import struct
+import zlib
+import tempfile
+from os.path import dirname, abspath
+
+from derpconf.config import Config, ConfigurationError
+
+# A shared configuration is a single read-only file, mapped into memory by
+# every process that attaches to it. Once the pre-fork master has attached,
+# workers share its pages instead of each holding a copy of every value.
+#
+# Layout: header, then key and value bytes, then an open addressing hash
+# table of slots pointing into them. Values are pickled and decoded each time
+# a key is read.
+
+MAGIC = b'DERPCONF'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIQ')
+SLOT = struct.Struct('<QIQI')
+
+
+def encode(config):
+    values = dict(config.items)
+    values.pop('defaults', None)
+
+    data = bytearray(HEADER.size)
+    offsets = {}
+
+    for key, value in sorted(values.items()):
+        try:
+            encoded = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as error:
+            raise ConfigurationError('Configuration %s can not be shared: %s' % (key, error))
+
+        offsets[key] = (len(data), len(encoded))
+        data += encoded
+
+    # aliases point to the same bytes as the key they stand for
+    for alias in type(config).class_aliased_items:
+        key = type(config)._canonical(alias)
+
+        if key in offsets and alias not in offsets:
+            offsets[alias] = offsets[key]
+
+    slot_count = 8
+    while slot_count < len(offsets) * 2:
+        slot_count *= 2
+
+    slots = [None] * slot_count
+
+    for key, (value_offset, value_length) in offsets.items():
+        encoded_key = key.encode('utf-8')
+        key_offset = len(data)
+        data += encoded_key
+
+        index = zlib.crc32(encoded_key) & (slot_count - 1)
+        while slots[index] is not None:
+            index = (index + 1) & (slot_count - 1)
+
+        slots[index] = (key_offset, len(encoded_key), value_offset, value_length)
+
+    table_offset = len(data)
+
+    for slot in slots:
+        data += SLOT.pack(*(slot or (0, 0, 0, 0)))
+
+    HEADER.pack_into(data, 0, MAGIC, VERSION, len(offsets), slot_count, table_offset)
+
+    return bytes(data)
+
+
+def export(config, path):
+    data = encode(config)
+    fd, temp_path = tempfile.mkstemp(dir=dirname(abspath(path)), prefix='.derpconf-')
+
+    try:
+        with os.fdopen(fd, 'wb') as shared_file:
+            shared_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return path
+
+
+def load(path, shared_path, config_class=Config, **kw):
+    export(config_class.load(path, **kw), shared_path)
+
+    return SharedConfig(shared_path)
+
+
+class SharedConfig(object):
+    def __init__(self, path):
+        with open(path, 'rb') as shared_file:
+            header = shared_file.read(HEADER.size)
+
+            if len(header) < HEADER.size or HEADER.unpack(header)[:2] != (MAGIC, VERSION):
+                raise ConfigurationError('%s is not a shared configuration file.' % path)
+
+            self._mmap = mmap.mmap(shared_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        count, slot_count, table_offset = HEADER.unpack(header)[2:]
+
+        self._path = path
+        self._count = count
+        self._slot_count = slot_count
+        self._table_offset = table_offset
+
+    def _find(self, name):
+        if not isinstance(name, str):
+            return None
+
+        encoded_key = name.encode('utf-8')
+        mask = self._slot_count - 1
+        index = zlib.crc32(encoded_key) & mask
+
+        while True:
+            key_offset, key_length, value_offset, value_length = SLOT.unpack_from(
+                self._mmap, self._table_offset + index * SLOT.size
+            )
+
+            if key_offset == 0:
+                return None
+
+            if self._mmap[key_offset:key_offset + key_length] == encoded_key:
+                return value_offset, value_length
+
+            index = (index + 1) & mask
+
+    def _decode(self, name):
+        location = self._find(name)
+
+        if location is None:
+            raise KeyError(name)
+
+        # values are decoded on every read and never kept, so workers do not
+        # end up with private copies of the shared pages
+        value_offset, value_length = location
+
+        return pickle.loads(self._mmap[value_offset:value_offset + value_length])
+
+    def keys(self):
+        keys = []
+
+        for index in range(self._slot_count):
+            key_offset, key_length = SLOT.unpack_from(self._mmap, self._table_offset + index * SLOT.size)[:2]
+
+            if key_offset != 0:
+                keys.append(self._mmap[key_offset:key_offset + key_length].decode('utf-8'))
+
+        return sorted(keys)
+
+    @property
+    def items(self):
+        return dict((key, self[key]) for key in self.keys())
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def close(self):
+        self._mmap.close()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        try:
+            return self._decode(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        try:
+            return self._decode(name)
+        except KeyError:
+            raise KeyError('No config called \'%s\'' % name)
+
+    def __setattr__(self, name, value):
+        if not name.startswith('_'):
+            raise AttributeError('Shared configurations are read-only.')
+        super(SharedConfig, self).__setattr__(name, value)
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self._count
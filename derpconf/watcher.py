@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import os
+import sys
+import time
+import select
+import logging
+import threading
+import ctypes
+import ctypes.util
+from os.path import dirname, isdir
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def inotify_available():
+    return sys.platform.startswith('linux') and ctypes.util.find_library('c') is not None
+
+
+class Inotify(object):
+    def __init__(self, paths):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        # lets stop() interrupt a pending wait
+        self.wake_read, self.wake_write = os.pipe()
+
+        for path in paths:
+            if libc.inotify_add_watch(self.fd, path.encode('utf-8'), WATCH_MASK) < 0:
+                errno = ctypes.get_errno()
+                self.close()
+                raise OSError(errno, 'inotify_add_watch failed for %s' % path)
+
+    def wait(self, timeout):
+        readable = select.select([self.fd, self.wake_read], [], [], timeout)[0]
+
+        if self.fd in readable:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+        return bool(readable)
+
+    def wake(self):
+        os.write(self.wake_write, b'x')
+
+    def close(self):
+        if self.fd >= 0:
+            for fd in (self.fd, self.wake_read, self.wake_write):
+                os.close(fd)
+            self.fd = -1
+
+
+class ConfigWatcher(object):
+    def __init__(self, config, interval=1.0, debounce=0.2, clock=time.monotonic, use_inotify=None):
+        self.config = config
+        self.interval = interval
+        self.debounce = debounce
+        self.clock = clock
+        self.use_inotify = inotify_available() if use_inotify is None else use_inotify
+
+        self.callbacks = []
+        self._signature = self.signature()
+        self._pending = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self._inotify = None
+
+    def on_change(self, callback):
+        self.callbacks.append(callback)
+        return callback
+
+    def paths(self):
+        folder = getattr(self.config, 'config_folder', None)
+
+        if folder is not None:
+            return self.config.get_folder_files(folder)
+
+        config_file = getattr(self.config, 'config_file', None)
+
+        return [config_file] if config_file is not None else []
+
+    def watched_folders(self):
+        folder = getattr(self.config, 'config_folder', None)
+
+        if folder is not None:
+            return [folder]
+
+        return sorted(set(dirname(path) or '.' for path in self.paths()))
+
+    def signature(self):
+        signature = []
+
+        for path in self.paths():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+
+        return tuple(signature)
+
+    def check(self):
+        signature = self.signature()
+        now = self.clock()
+
+        # waits for writes to settle before reloading, so a burst of writes
+        # results in a single reload
+        if signature != self._signature:
+            self._signature = signature
+            self._pending = now
+            return {}
+
+        if self._pending is None or now - self._pending < self.debounce:
+            return {}
+
+        self._pending = None
+        diff = self.config.reload()
+
+        if diff:
+            self.notify(diff)
+
+        return diff
+
+    def notify(self, diff):
+        keys = sorted(diff)
+        old = dict((key, diff[key][0]) for key in keys)
+        new = dict((key, diff[key][1]) for key in keys)
+
+        for callback in list(self.callbacks):
+            try:
+                callback(keys, old, new)
+            except Exception:
+                logging.exception('Configuration change callback %r failed.' % callback)
+
+    def wait(self):
+        timeout = self.debounce if self._pending is not None else self.interval
+
+        if self._inotify is not None:
+            self._inotify.wait(timeout)
+        else:
+            self._stopped.wait(timeout)
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.wait()
+
+            if self._stopped.is_set():
+                break
+
+            try:
+                self.check()
+            except Exception:
+                logging.exception('Failed to reload configuration.')
+
+    def start(self):
+        if self._thread is not None:
+            return self
+
+        if self.use_inotify:
+            try:
+                self._inotify = Inotify([folder for folder in self.watched_folders() if isdir(folder)])
+            except OSError:
+                logging.warning('inotify is not available, falling back to polling configuration files.')
+                self._inotify = None
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.run, name='derpconf-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._inotify is not None:
+            self._inotify.wake()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
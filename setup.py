@@ -18,7 +18,6 @@ tests_require = [
     'coverage',
     'colorama',
     'tox',
-    'six',
 ]
 
 
@@ -49,9 +48,7 @@ def run_setup(extension_modules=[]):
         ],
         packages=['derpconf'],
         package_dir={"derpconf": "derpconf"},
-        install_requires=[
-            'six',
-        ],
+        install_requires=[],
 
         extras_require={
             'tests': tests_require,
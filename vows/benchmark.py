@@ -0,0 +1,573 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+# Micro-benchmarks for derpconf hot paths.
+# Run with: make benchmark, or
+#   PYTHONPATH=. python vows/benchmark.py [--sizes 10,1000] [--json out.json] [--compare old.json] [name ...]
+
+import io
+import os
+import sys
+import time
+import asyncio
+import json
+import argparse
+import platform
+import subprocess
+import tempfile
+import threading
+import timeit
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os.path import join
+
+from derpconf.config import Config, ConfigurationError
+from derpconf.remote import HTTPSource
+
+
+class ProcessConfig(Config):
+    bytecode_cache = False
+    load_executor = 'process'
+
+
+def special_config():
+    class SpecialConfig(Config):
+        class_defaults = {}
+        class_group_items = defaultdict(list)
+        class_groups = []
+        class_descriptions = {}
+        class_aliases = defaultdict(list)
+        class_aliased_items = {}
+
+    return SpecialConfig
+
+
+# numbers of keys of the generated configurations, changed with --sizes
+SIZES = [10, 1000, 10000, 100000]
+
+RESULTS = {}
+
+
+def rate(func, number):
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    return number / best
+
+
+def times(keys, budget=20000):
+    # how many times to run an operation on keys keys per measurement
+    return max(1, budget // keys)
+
+
+def report(name, value, unit):
+    RESULTS[name] = {'value': value, 'unit': unit}
+    sys.stdout.write('%-48s %14.0f %s\n' % (name, value, unit))
+
+
+def write_config(keys, path=None):
+    if path is None:
+        path = join(tempfile.mkdtemp(), 'generated.conf')
+
+    with open(path, 'w') as config_file:
+        for index in range(keys):
+            config_file.write("KEY_%d = 'value %d'\n" % (index, index))
+
+    return path
+
+
+def bench_load():
+    for keys in SIZES:
+        load_keys(keys, times(keys))
+
+
+def load_keys(keys, number):
+    path = write_config(keys)
+
+    class UncachedConfig(special_config()):
+        bytecode_cache = False
+        parse_mode = 'exec'
+
+    class CachedConfig(special_config()):
+        bytecode_cache = True
+        bytecode_cache_dir = tempfile.mkdtemp()
+        bytecode_cache_stats = {'hits': 0, 'misses': 0}
+        parse_mode = 'exec'
+
+    class LiteralConfig(special_config()):
+        bytecode_cache = False
+        parse_mode = 'literal'
+
+    class CachedLiteralConfig(special_config()):
+        bytecode_cache = True
+        bytecode_cache_dir = tempfile.mkdtemp()
+        bytecode_cache_stats = {'hits': 0, 'misses': 0}
+        parse_mode = 'literal'
+
+    CachedConfig.load(path)
+    CachedLiteralConfig.load(path)
+
+    report('load: %d keys (no bytecode cache)' % keys, rate(lambda: UncachedConfig.load(path), number), 'loads/s')
+    report('load: %d keys (bytecode cache)' % keys, rate(lambda: CachedConfig.load(path), number), 'loads/s')
+    report('load: %d keys (literal parser)' % keys, rate(lambda: LiteralConfig.load(path), number), 'loads/s')
+    report('load: %d keys (literal parser, cached)' % keys, rate(lambda: CachedLiteralConfig.load(path), number), 'loads/s')
+
+
+def write_formats(keys):
+    folder = tempfile.mkdtemp()
+    values = [('KEY_%d' % index, 'value %d' % index) for index in range(keys)]
+
+    with open(join(folder, 'generated.json'), 'w') as config_file:
+        json.dump(dict(values), config_file)
+
+    with open(join(folder, 'generated.toml'), 'w') as config_file:
+        config_file.writelines('%s = "%s"\n' % value for value in values)
+
+    with open(join(folder, 'generated.yaml'), 'w') as config_file:
+        config_file.writelines('%s: %s\n' % value for value in values)
+
+    with open(join(folder, 'generated.ini'), 'w') as config_file:
+        config_file.write('[DEFAULT]\n')
+        config_file.writelines('%s = %s\n' % value for value in values)
+
+    with open(join(folder, 'generated.env'), 'w') as config_file:
+        config_file.writelines('%s="%s"\n' % value for value in values)
+
+    return folder
+
+
+def bench_formats(number=5, keys=10000):
+    folder = write_formats(keys)
+    path = write_config(keys)
+
+    class UncachedConfig(special_config()):
+        bytecode_cache = False
+        parse_mode = 'exec'
+
+    report('formats: %d keys (.conf, exec)' % keys, rate(lambda: UncachedConfig.load(path), number), 'loads/s')
+
+    for extension in ('json', 'toml', 'yaml', 'ini', 'env'):
+        generated = join(folder, 'generated.%s' % extension)
+
+        try:
+            UncachedConfig.load(generated)
+        except ConfigurationError as error:
+            sys.stdout.write('formats: %s skipped (%s)\n' % (extension, error))
+            continue
+
+        report('formats: %d keys (.%s)' % (keys, extension), rate(lambda: UncachedConfig.load(generated), number), 'loads/s')
+
+
+def bench_folder(keys=50):
+    # folders of 50 key files, with as many keys in total as each size
+    for size in SIZES:
+        if size >= 100:
+            load_folder(size // keys, keys, times(size, 5000))
+
+
+def load_folder(files, keys, number):
+    folder = tempfile.mkdtemp()
+
+    for index in range(files):
+        with open(join(folder, '%03d.conf' % index), 'w') as config_file:
+            for key in range(keys):
+                config_file.write("KEY_%d_%d = 'value'\nif KEY_%d_%d: pass\n" % (index, key, index, key))
+
+    class UncachedConfig(special_config()):
+        bytecode_cache = False
+
+    report('folder: %d files of %d keys (sequential)' % (files, keys), rate(lambda: UncachedConfig.load(folder), number), 'loads/s')
+    report('folder: %d files of %d keys (4 threads)' % (files, keys), rate(lambda: UncachedConfig.load(folder, workers=4), number), 'loads/s')
+
+    # process pools pickle the configuration class, so it can not be local
+    report('folder: %d files of %d keys (4 processes)' % (files, keys), rate(lambda: ProcessConfig.load(folder, workers=4), number), 'loads/s')
+
+
+def bench_verify(number=3, files=200, keys=50):
+    folder = tempfile.mkdtemp()
+    paths = [write_config(keys, join(folder, '%03d.conf' % index)) for index in range(files)]
+
+    for key in range(max(SIZES + [keys])):
+        ProcessConfig.define('KEY_%d' % key, 'default', 'Generated key')
+
+    for size in SIZES:
+        path = write_config(size)
+        report('verify: %d keys' % size, rate(lambda: ProcessConfig.verify(path), times(size)), 'calls/s')
+        report('verify: %d keys (verify_file)' % size, rate(lambda: ProcessConfig.verify_file(path), times(size)), 'calls/s')
+
+    report('verify: %d files (verify)' % files, rate(lambda: [ProcessConfig.verify(path) for path in paths], number), 'batches/s')
+    report('verify: %d files (verify_files)' % files, rate(lambda: ProcessConfig.verify_files(paths), number), 'batches/s')
+    report('verify: %d files (4 processes)' % files, rate(lambda: ProcessConfig.verify_files(paths, 4), number), 'batches/s')
+
+
+def bench_async(keys=10000, reloads=5):
+    path = write_config(keys)
+
+    class UncachedConfig(special_config()):
+        bytecode_cache = False
+        parse_mode = 'exec'
+
+    async def stall(reload):
+        # the longest the event loop went without running a 1ms ticker
+        conf = await UncachedConfig.aload(path)
+        worst = 0
+        running = True
+
+        async def ticker():
+            nonlocal worst
+            last = time.perf_counter()
+
+            while running:
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                worst = max(worst, now - last)
+                last = now
+
+        task = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0.01)
+
+        for index in range(reloads):
+            await reload(conf)
+
+        running = False
+        await task
+
+        return worst
+
+    async def blocking(conf):
+        conf.reload(force=True)
+
+    async def non_blocking(conf):
+        await conf.areload(force=True)
+
+    report('async: %d keys, loop stall (reload)' % keys, asyncio.run(stall(blocking)) * 1000, 'ms')
+    report('async: %d keys, loop stall (areload)' % keys, asyncio.run(stall(non_blocking)) * 1000, 'ms')
+
+
+def bench_lookup(number=200000):
+    SpecialConfig = special_config()
+    SpecialConfig.define('DEFAULT_ONLY', 'default', 'Key with only a default value')
+    SpecialConfig.define('FROM_FILE', 'default', 'Key overridden by the config')
+    SpecialConfig.alias('ALIASED', 'DEFAULT_ONLY')
+
+    conf = SpecialConfig(defaults={'FROM_DEFAULTS': 'value'}, FROM_FILE='value')
+
+    report('lookup: direct', rate(lambda: conf.FROM_FILE, number), 'reads/s')
+    report('lookup: instance defaults', rate(lambda: conf.FROM_DEFAULTS, number), 'reads/s')
+    report('lookup: class defaults', rate(lambda: conf.DEFAULT_ONLY, number), 'reads/s')
+    report('lookup: deprecated alias', rate(lambda: conf.ALIASED, number), 'reads/s')
+
+    conf.add_source('remote', {'FROM_SOURCE': 'value'})
+    report('lookup: added source', rate(lambda: conf.FROM_SOURCE, number), 'reads/s')
+    report('lookup: source_of', rate(lambda: conf.source_of('FROM_SOURCE'), number), 'calls/s')
+
+    frozen = conf.freeze()
+    report('lookup: frozen', rate(lambda: frozen.DEFAULT_ONLY, number), 'reads/s')
+
+    with conf.override(OVERRIDDEN='value'):
+        report('lookup: direct (inside override)', rate(lambda: conf.FROM_FILE, number), 'reads/s')
+        report('lookup: overridden', rate(lambda: conf.OVERRIDDEN, number), 'reads/s')
+
+    overlay = conf.overlay({'OVERRIDDEN': 'value'})
+    report('lookup: overlay', rate(lambda: overlay.OVERRIDDEN, number), 'reads/s')
+    report('lookup: overlay, read through', rate(lambda: overlay.FROM_FILE, number), 'reads/s')
+
+    def override():
+        with conf.override(OVERRIDDEN='value'):
+            pass
+
+    report('lookup: override enter and exit', rate(override, number), 'calls/s')
+
+    SpecialConfig._allow_environment_variables = True
+    report('lookup: direct (env enabled)', rate(lambda: conf.FROM_FILE, number), 'reads/s')
+    report('lookup: class defaults (env enabled)', rate(lambda: conf.DEFAULT_ONLY, number), 'reads/s')
+
+    SpecialConfig.allow_environment_variables(snapshot=True)
+    report('lookup: direct (env snapshot)', rate(lambda: conf.FROM_FILE, number), 'reads/s')
+    report('lookup: class defaults (env snapshot)', rate(lambda: conf.DEFAULT_ONLY, number), 'reads/s')
+
+
+def bench_profile(number=200000):
+    SpecialConfig = special_config()
+    SpecialConfig.define('DEFAULT_ONLY', 'default', 'Key with only a default value')
+
+    conf = SpecialConfig(FROM_FILE='value')
+
+    report('profile: direct (never profiled)', rate(lambda: conf.FROM_FILE, number), 'reads/s')
+
+    profiler = SpecialConfig.profile()
+    report('profile: direct (profiling)', rate(lambda: conf.FROM_FILE, number), 'reads/s')
+    profiler.stop()
+
+    report('profile: direct (profiler stopped)', rate(lambda: conf.FROM_FILE, number), 'reads/s')
+
+
+def bench_config_text():
+    nested = tuple(('item %d' % index, [index, (index, 'nested')]) for index in range(5))
+
+    for keys in SIZES:
+        SpecialConfig = special_config()
+
+        # one in ten keys has a nested default
+        for index in range(keys):
+            default = nested if index % 10 == 0 else 'value %d' % index
+            SpecialConfig.define('KEY_%d' % index, default, 'Generated key number %d. ' % index * 5, 'Group %d' % (index % 50))
+
+        def uncached():
+            SpecialConfig.invalidate()
+            return SpecialConfig.get_config_text()
+
+        number = times(keys, 2000)
+
+        report('config text: %d keys' % keys, rate(uncached, number), 'calls/s')
+        report('config text: %d keys (cached)' % keys, rate(SpecialConfig.get_config_text, number), 'calls/s')
+        report('config text: %d keys (streamed)' % keys,
+               rate(lambda: SpecialConfig.write_config_text(io.StringIO()), number), 'calls/s')
+
+
+def bench_define(keys=20000, groups=2000):
+    def define():
+        SpecialConfig = special_config()
+
+        for index in range(keys):
+            SpecialConfig.define('KEY_%d' % index, index, 'Generated key', 'Group %d' % (index % groups))
+
+    report('define: %d keys in %d groups' % (keys, groups), keys * rate(define, 1), 'defines/s')
+
+
+def bench_items(number=1000):
+    for keys in SIZES:
+        SpecialConfig = special_config()
+
+        for index in range(keys):
+            SpecialConfig.define('KEY_%d' % index, index, 'Generated key')
+
+        conf = SpecialConfig(defaults={'FROM_DEFAULTS': 'value'}, FROM_FILE='value')
+        conf.items
+
+        report('items: %d keys' % keys, rate(lambda: conf.items, number), 'calls/s')
+        report('items: %d keys, membership' % keys, rate(lambda: 'KEY_1' in conf.items, number), 'calls/s')
+
+        def changed():
+            conf.FROM_FILE = 'changed'
+            return conf.items
+
+        report('items: %d keys, after a change' % keys, rate(changed, times(keys)), 'calls/s')
+
+
+def bench_remote():
+    served = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.headers.get('If-None-Match') == '"1"':
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header('ETag', '"1"')
+            self.send_header('Content-Length', str(len(served['body'])))
+            self.end_headers()
+            self.wfile.write(served['body'])
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    url = 'http://127.0.0.1:%d/config.json' % server.server_port
+
+    try:
+        for keys in SIZES:
+            served['body'] = json.dumps(dict(('KEY_%d' % index, 'value %d' % index) for index in range(keys))).encode()
+            conf = special_config().load(None, remote=HTTPSource(url, cache_path=join(tempfile.mkdtemp(), 'remote.json')))
+            number = times(keys, 2000)
+
+            report('remote: %d keys, reload (not modified)' % keys, rate(conf.reload, number), 'reloads/s')
+            report('remote: %d keys, reload (refetched)' % keys, rate(lambda: conf.reload(force=True), number), 'reloads/s')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def bench_section(number=1000):
+    for keys in SIZES:
+        SpecialConfig = special_config()
+
+        # a hundred keys in STORAGE_S3, the rest spread over other sections
+        for index in range(keys):
+            prefix = 'STORAGE_S3' if index < 100 else 'SECTION_%d' % (index % 50)
+            SpecialConfig.define('%s_KEY_%d' % (prefix, index), index, 'Generated key')
+
+        conf = SpecialConfig(STORAGE_S3_FROM_FILE='value')
+        section = conf.section('STORAGE_S3')
+        list(section)
+
+        def scan():
+            return [key for key in conf.items if key.startswith('STORAGE_S3_')]
+
+        report('section: %d keys, keys by scanning items' % keys, rate(scan, times(keys, 100000)), 'calls/s')
+        report('section: %d keys, keys' % keys, rate(section.keys, number), 'calls/s')
+        report('section: %d keys, read' % keys, rate(lambda: section.FROM_FILE, number * 100), 'reads/s')
+
+
+def bench_reload():
+    for keys in SIZES:
+        number = times(keys)
+        path = write_config(keys)
+
+        class UncachedConfig(special_config()):
+            bytecode_cache = False
+
+        conf = UncachedConfig.load(path)
+
+        report('reload: %d keys (unchanged)' % keys, rate(conf.reload, 1000), 'reloads/s')
+        report('reload: %d keys (forced)' % keys, rate(lambda: conf.reload(force=True), number), 'reloads/s')
+
+        # a folder where a single 10 key file changes between reloads
+        folder = tempfile.mkdtemp()
+
+        for index in range(max(1, keys // 10)):
+            write_config(10, join(folder, '%05d.conf' % index))
+
+        conf = UncachedConfig.load(folder)
+        changed = join(folder, '00000.conf')
+        state = {'size': 10}
+
+        def reload_one():
+            state['size'] = 21 - state['size']
+            write_config(state['size'], changed)
+            return conf.reload()
+
+        report('reload: %d keys in folder (one file changed)' % keys, rate(reload_one, times(keys, 1000)), 'reloads/s')
+
+
+def import_time(statement, repeat=5):
+    # best wall time of a fresh interpreter running statement, in ms
+    best = None
+
+    for index in range(repeat):
+        started = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', statement], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best * 1000
+
+
+def bench_startup(number=10000):
+    interpreter = import_time('pass')
+    report('startup: import derpconf.config', import_time('import derpconf.config') - interpreter, 'ms')
+
+    SpecialConfig = special_config()
+    SpecialConfig.define('KEY', 'default', 'Generated key')
+
+    report('startup: Config()', rate(SpecialConfig, number), 'instances/s')
+    report('startup: Config(values)', rate(lambda: SpecialConfig(KEY='value', OTHER='value'), number), 'instances/s')
+
+    path = join(tempfile.mkdtemp(), 'small.conf')
+
+    with open(path, 'w') as config_file:
+        config_file.write('KEY = "value"\nif KEY:\n    OTHER = KEY.upper()\n')
+
+    class UncachedConfig(SpecialConfig):
+        bytecode_cache = False
+
+    report('startup: load small executed file', rate(lambda: UncachedConfig.load(path), number // 10), 'loads/s')
+
+
+BENCHMARKS = {
+    'async': bench_async,
+    'config_text': bench_config_text,
+    'define': bench_define,
+    'folder': bench_folder,
+    'formats': bench_formats,
+    'items': bench_items,
+    'load': bench_load,
+    'lookup': bench_lookup,
+    'profile': bench_profile,
+    'reload': bench_reload,
+    'remote': bench_remote,
+    'section': bench_section,
+    'startup': bench_startup,
+    'verify': bench_verify,
+}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(path):
+    with open(path) as results_file:
+        previous = json.load(results_file)
+
+    sys.stdout.write('\nCompared to %s (%s):\n' % (path, previous.get('revision') or 'unknown revision'))
+
+    for name, result in sorted(RESULTS.items()):
+        if name not in previous['results']:
+            continue
+
+        old = previous['results'][name]['value']
+        change = (result['value'] - old) / old * 100 if old else 0
+
+        # lower is better for durations, higher for rates
+        if result['unit'] in ('ms', 's'):
+            change = -change
+
+        sys.stdout.write('%-48s %+8.1f%%\n' % (name, change))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Runs the derpconf benchmarks.')
+    parser.add_argument('names', nargs='*', metavar='name', help='benchmarks to run, all by default: %s' % ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--sizes', help='comma separated numbers of keys of the generated configurations')
+    parser.add_argument('--json', help='saves the results to this file')
+    parser.add_argument('--compare', help='compares the results to the ones saved in this file')
+    options = parser.parse_args(args)
+
+    unknown = [name for name in options.names if name not in BENCHMARKS]
+
+    if unknown:
+        parser.error('unknown benchmarks: %s' % ', '.join(unknown))
+
+    if options.sizes:
+        SIZES[:] = [int(size) for size in options.sizes.split(',')]
+
+    for name in options.names or sorted(BENCHMARKS):
+        BENCHMARKS[name]()
+
+    if options.json:
+        with open(options.json, 'w') as results_file:
+            json.dump({
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'sizes': SIZES,
+                'results': RESULTS,
+            }, results_file, indent=2, sort_keys=True)
+
+    if options.compare:
+        compare(options.compare)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
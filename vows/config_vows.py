@@ -8,17 +8,49 @@
 # http://www.opensource.org/licenses/mit-license
 # Copyright (c) 2012 globo.com timehome@corp.globo.com
 
+import io
 import os
+import asyncio
+import json
+import logging
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
 from os.path import abspath, join, dirname
 from collections import defaultdict
 
 from pyvows import Vows, expect
 
-from derpconf.config import Config, ConfigurationError
+from derpconf.config import Config, ConfigurationError, ValidationError, lazy, verify_configs
 
 fix = lambda name: abspath(join(dirname(__file__), 'fixtures', name))
 
 
+class ProcessConfig(Config):
+    # loaded by worker processes, which need the class to be importable
+    bytecode_cache = True
+    bytecode_cache_dir = tempfile.mkdtemp()
+    load_workers = 2
+    load_executor = 'process'
+
+
+class VerifiedConfig(Config):
+    # verified by worker processes, which import it along with its options
+    class_defaults = {}
+    class_group_items = defaultdict(list)
+    class_groups = []
+    class_descriptions = {}
+    class_aliases = defaultdict(list)
+    class_aliased_items = {}
+    class_schema = {}
+
+
+VerifiedConfig.define('QUALITY', 80, 'Quality', type=int, max_value=100)
+VerifiedConfig.define('STORAGE', 'file', 'Storage')
+
+
 @Vows.batch
 class Configuration(Vows.Context):
     class WhenLoading(Vows.Context):
@@ -139,6 +171,142 @@ class Configuration(Vows.Context):
             def topic(self):
                 return Config()
 
+    class WhenChainingAliases(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('NEWEST', 'default', 'Newest name')
+            SpecialConfig.alias('OLDER', 'OLDEST')
+            SpecialConfig.alias('OLDEST', 'NEWEST')
+
+            return SpecialConfig
+
+        def should_point_every_alias_at_the_canonical_key(self, topic):
+            expect(topic.class_aliased_items).to_equal({'OLDER': 'NEWEST', 'OLDEST': 'NEWEST'})
+            expect(sorted(topic.class_aliases['NEWEST'])).to_equal(['OLDER', 'OLDEST'])
+
+        def should_read_through_aliases(self, topic):
+            expect(topic(NEWEST='value').OLDER).to_equal('value')
+
+        class WhenAliasWouldCreateCycle(Vows.Context):
+            def topic(self, config_class):
+                err = expect.error_to_happen(ConfigurationError)
+
+                with err:
+                    config_class.alias('NEWEST', 'OLDER')
+
+                return err
+
+            def should_be_an_error(self, topic):
+                expect(topic).to_be_an_error_like(ConfigurationError)
+
+    class WhenReadingAliases(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('CURRENT_NAME', 'default', 'Current name')
+            SpecialConfig.alias('LEGACY_NAME_READ', 'CURRENT_NAME')
+
+            messages = []
+
+            class Handler(logging.Handler):
+                def emit(self, record):
+                    messages.append(record.getMessage())
+
+            handler = Handler()
+            logging.getLogger().addHandler(handler)
+
+            try:
+                conf = SpecialConfig()
+                values = [conf.LEGACY_NAME_READ for index in range(3)]
+                conf.CURRENT_NAME = 'changed'
+                values.append(conf.LEGACY_NAME_READ)
+            finally:
+                logging.getLogger().removeHandler(handler)
+
+            return values, [message for message in messages if 'LEGACY_NAME_READ' in message]
+
+        def should_read_the_canonical_value(self, topic):
+            expect(topic[0]).to_equal(['default', 'default', 'default', 'changed'])
+
+        def should_warn_once(self, topic):
+            expect(topic[1]).to_equal([
+                'Option LEGACY_NAME_READ is marked as deprecated please use CURRENT_NAME instead.'
+            ])
+
+    class WhenSubclassing(Vows.Context):
+        def topic(self):
+            class ParentConfig(Config):
+                pass
+
+            ParentConfig.define('PARENT_OPTION', 'parent', 'Parent option', 'Parent')
+
+            class ChildConfig(ParentConfig):
+                pass
+
+            ChildConfig.define('CHILD_OPTION', 'child', 'Child option', 'Child')
+            ChildConfig.define('OVERRIDDEN_OPTION', 'child', 'Overridden option', 'Child')
+            ParentConfig.define('OVERRIDDEN_OPTION', 'parent', 'Overridden option', 'Parent')
+            ParentConfig.define('LATE_OPTION', 'late', 'Option defined after subclassing', 'Parent')
+            ParentConfig.define('LATE_OPTION', 'later', 'Option defined after subclassing', 'Parent')
+            ParentConfig.alias('OLD_PARENT_OPTION', 'PARENT_OPTION')
+
+            return ParentConfig, ChildConfig
+
+        def should_not_leak_into_parents(self, topic):
+            expect(topic[0].class_defaults).not_to_include('CHILD_OPTION')
+            expect(Config.class_defaults).not_to_include('CHILD_OPTION')
+            expect(Config.class_defaults).not_to_include('PARENT_OPTION')
+            expect(topic[0].get_config_text()).not_to_include('CHILD_OPTION')
+
+        def should_inherit_parent_options(self, topic):
+            conf = topic[1]()
+
+            expect(conf.PARENT_OPTION).to_equal('parent')
+            expect(conf.LATE_OPTION).to_equal('later')
+            expect(conf.OLD_PARENT_OPTION).to_equal('parent')
+
+        def should_keep_own_definitions(self, topic):
+            expect(topic[1]().OVERRIDDEN_OPTION).to_equal('child')
+            expect(topic[0]().OVERRIDDEN_OPTION).to_equal('parent')
+
+        def should_list_each_option_once(self, topic):
+            expect(topic[1].class_group_items['Parent']).to_equal(['PARENT_OPTION', 'LATE_OPTION'])
+            expect(topic[1].class_groups.count('Parent')).to_equal(1)
+
+        class WhenRedefiningInAnotherGroup(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    pass
+
+                SpecialConfig.define('KEPT_OPTION', 'kept', 'Kept option', 'First')
+                SpecialConfig.define('MOVED_OPTION', 'moved', 'Moved option', 'First')
+                SpecialConfig.define('ALONE_OPTION', 'alone', 'Alone option', 'Second')
+                SpecialConfig.define('MOVED_OPTION', 'moved', 'Moved option', 'Third')
+                SpecialConfig.define('ALONE_OPTION', 'alone', 'Alone option', 'Third')
+
+                return SpecialConfig
+
+            def should_move_options_to_their_new_group(self, topic):
+                expect(topic.class_group_items['First']).to_equal(['KEPT_OPTION'])
+                expect(topic.class_group_items['Third']).to_equal(['MOVED_OPTION', 'ALONE_OPTION'])
+
+            def should_drop_empty_groups(self, topic):
+                expect(topic.class_groups[-2:]).to_equal(['First', 'Third'])
+                expect(topic.class_group_items).not_to_include('Second')
+
     class WhenVerifying(Vows.Context):
         def topic(self):
             class SpecialConfig(Config):
@@ -154,6 +322,328 @@ class Configuration(Vows.Context):
         def should_be_lengthy(self, topic):
             expect(topic).to_length(1)
 
+    class WhenVerifyingManyFiles(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+                class_schema = {}
+
+            SpecialConfig.define('QUALITY', 80, 'Quality', type=int, max_value=100)
+            SpecialConfig.define('ENGINE', 'pil', 'Engine')
+            SpecialConfig.alias('OLD_ENGINE', 'ENGINE')
+
+            folder = tempfile.mkdtemp()
+
+            for name, text in (('01-good.conf', 'QUALITY = 90\nOLD_ENGINE = "gm"\n'),
+                               ('02-bad.conf', 'QUALITY = 150\nQUALTY = 90\n'),
+                               ('03-broken.conf', 'QUALITY = (\n')):
+                with open(join(folder, name), 'w') as config_file:
+                    config_file.write(text)
+
+            output = io.StringIO()
+            status = verify_configs(['--json', join(folder, '*-good.conf'), join(folder, '0[23]-*.conf')],
+                                    SpecialConfig, output)
+
+            text_output = io.StringIO()
+            verify_configs([folder], SpecialConfig, text_output)
+
+            return status, json.loads(output.getvalue()), text_output.getvalue(), folder
+
+        def should_fail(self, topic):
+            expect(topic[0]).to_equal(1)
+
+        def should_report_valid_files(self, topic):
+            expect(topic[1][0]).to_equal({
+                'path': join(topic[3], '01-good.conf'),
+                'missing': [],
+                'unknown': [],
+                'errors': [],
+                'valid': True,
+            })
+
+        def should_report_unknown_keys_and_errors(self, topic):
+            expect(topic[1][1]['unknown']).to_equal(['QUALTY'])
+            expect(topic[1][1]['missing']).to_equal(['ENGINE'])
+            expect(topic[1][1]['errors']).to_equal([{'key': 'QUALITY', 'error': '150 is greater than 100'}])
+
+        def should_report_broken_files(self, topic):
+            expect(topic[1][2]['valid']).to_be_false()
+            expect(topic[1][2]['errors'][0]['error']).to_include('SyntaxError')
+
+        def should_write_text_report(self, topic):
+            expect(topic[2]).to_include('01-good.conf: ok\n')
+            expect(topic[2]).to_include('02-bad.conf: invalid\n  QUALITY: 150 is greater than 100\n  QUALTY: unknown key\n')
+
+        class WhenUsingWorkerProcesses(Vows.Context):
+            def topic(self):
+                folder = tempfile.mkdtemp()
+                paths = []
+
+                for index, text in enumerate(['QUALITY = 90\n', 'QUALITY = 150\nQUALTY = 1\n', 'QUALITY = (\n'] * 2):
+                    path = join(folder, '%02d.conf' % index)
+                    paths.append(path)
+
+                    with open(path, 'w') as config_file:
+                        config_file.write(text)
+
+                return VerifiedConfig.verify_files(paths), VerifiedConfig.verify_files(paths, workers=2)
+
+            def should_report_like_a_single_process(self, topic):
+                expect(topic[1]).to_equal(topic[0])
+
+            def should_check_the_schema(self, topic):
+                expect([report['valid'] for report in topic[1]]).to_equal([True, False, False] * 2)
+                expect(topic[1][1]['errors']).to_equal([{'key': 'QUALITY', 'error': '150 is greater than 100'}])
+                expect(topic[1][1]['unknown']).to_equal(['QUALTY'])
+                expect(topic[1][0]['missing']).to_equal(['STORAGE'])
+
+    class WhenCachingCompiledFiles(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                bytecode_cache = True
+                bytecode_cache_dir = tempfile.mkdtemp()
+                bytecode_cache_stats = {'hits': 0, 'misses': 0}
+                parse_mode = 'exec'
+
+            path = join(tempfile.mkdtemp(), 'cached.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write('CACHED = 1\n')
+
+            SpecialConfig.load(path)
+            SpecialConfig.load(path)
+            stats = dict(SpecialConfig.bytecode_cache_stats)
+
+            with open(path, 'w') as config_file:
+                config_file.write('CACHED = 22\n')
+
+            config = SpecialConfig.load(path)
+
+            return stats, dict(SpecialConfig.bytecode_cache_stats), config, SpecialConfig.get_bytecode_path(path)
+
+        def should_hit_cache_on_second_load(self, topic):
+            expect(topic[0]).to_equal({'hits': 1, 'misses': 1})
+
+        def should_recompile_changed_file(self, topic):
+            expect(topic[1]).to_equal({'hits': 1, 'misses': 2})
+            expect(topic[2].CACHED).to_equal(22)
+
+        def should_write_cache_file(self, topic):
+            expect(os.path.exists(topic[3])).to_be_true()
+
+        class WhenFileIsPrivate(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    bytecode_cache = True
+                    bytecode_cache_dir = tempfile.mkdtemp()
+
+                path = join(tempfile.mkdtemp(), 'secret.conf')
+
+                with open(path, 'w') as config_file:
+                    config_file.write("DB_PASSWORD = 'hunter2'\n")
+                os.chmod(path, 0o600)
+
+                SpecialConfig.load(path)
+
+                return os.stat(SpecialConfig.get_bytecode_path(path)).st_mode & 0o777
+
+            def should_not_be_readable_by_others(self, topic):
+                expect(topic).to_equal(0o600)
+
+        class WhenFileChangesWhileLoading(Vows.Context):
+            def topic(self):
+                import derpconf.config as config_module
+
+                class SpecialConfig(Config):
+                    bytecode_cache = True
+                    bytecode_cache_dir = tempfile.mkdtemp()
+                    bytecode_cache_stats = {'hits': 0, 'misses': 0}
+
+                path = join(tempfile.mkdtemp(), 'racing.conf')
+
+                with open(path, 'w') as config_file:
+                    config_file.write('X = 1\n')
+
+                parse = config_module.parse_literal_config
+
+                def rewrite_then_parse(source):
+                    # the file is rewritten after it was read, before the
+                    # cache is written
+                    with open(path, 'w') as config_file:
+                        config_file.write('X = 22\n')
+
+                    return parse(source)
+
+                config_module.parse_literal_config = rewrite_then_parse
+
+                try:
+                    first = SpecialConfig.load(path).X
+                finally:
+                    config_module.parse_literal_config = parse
+
+                return first, SpecialConfig.load(path).X, dict(SpecialConfig.bytecode_cache_stats)
+
+            def should_not_cache_old_values_for_the_new_file(self, topic):
+                expect(topic[0]).to_equal(1)
+                expect(topic[1]).to_equal(22)
+                expect(topic[2]).to_equal({'hits': 0, 'misses': 2})
+
+        class WhenDisabled(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    bytecode_cache = False
+                    bytecode_cache_stats = {'hits': 0, 'misses': 0}
+                    parse_mode = 'exec'
+
+                SpecialConfig.load(fix('sample.conf'))
+
+                return SpecialConfig.bytecode_cache_stats
+
+            def should_not_use_cache(self, topic):
+                expect(topic).to_equal({'hits': 0, 'misses': 0})
+
+        class WhenNotEnabled(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    pass
+
+                SpecialConfig.load(fix('sample.conf'))
+
+                return Config.bytecode_cache, SpecialConfig.bytecode_cache_stats, Config.bytecode_cache_stats
+
+            def should_be_disabled_by_default(self, topic):
+                expect(topic[0]).to_be_false()
+
+            def should_count_apart_from_the_parent_class(self, topic):
+                expect(topic[1]).to_equal({'hits': 0, 'misses': 0})
+                expect(topic[1] is topic[2]).to_be_false()
+
+        class WhenLoadingWithProcesses(Vows.Context):
+            def topic(self):
+                folder = tempfile.mkdtemp()
+
+                for index in range(3):
+                    with open(join(folder, '%02d.conf' % index), 'w') as config_file:
+                        config_file.write('VALUE_%d = %d\n' % (index, index))
+
+                ProcessConfig.load(folder)
+                config = ProcessConfig.load(folder)
+
+                return config, dict(ProcessConfig.bytecode_cache_stats)
+
+            def should_load_every_file(self, topic):
+                expect([topic[0].VALUE_0, topic[0].VALUE_1, topic[0].VALUE_2]).to_equal([0, 1, 2])
+
+            def should_count_what_the_workers_read(self, topic):
+                expect(topic[1]).to_equal({'hits': 3, 'misses': 3})
+
+    class WhenParsingLiteralFiles(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                bytecode_cache = False
+                parse_mode = 'literal'
+
+            path = join(tempfile.mkdtemp(), 'literal.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write(
+                    '# generated\n'
+                    'STRING = "value"  # comment\n'
+                    'NUMBER = 10\n'
+                    'RATIO = .5\n'
+                    'ENABLED = False\n'
+                    'NESTED = {\n'
+                    '    "list": [1, 2],\n'
+                    '}\n'
+                )
+
+            return SpecialConfig.load(path)
+
+        def should_read_values(self, topic):
+            expect(topic.STRING).to_equal('value')
+            expect(topic.NUMBER).to_equal(10)
+            expect(topic.RATIO).to_equal(0.5)
+            expect(topic.ENABLED).to_be_false()
+            expect(topic.NESTED).to_equal({'list': [1, 2]})
+
+        class WhenFileHasCode(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    bytecode_cache = False
+                    parse_mode = 'literal'
+
+                path = join(tempfile.mkdtemp(), 'code.conf')
+
+                with open(path, 'w') as config_file:
+                    config_file.write('import os\nJOINED_PATH = os.path.join("a", "b")\n')
+
+                err = expect.error_to_happen(ConfigurationError)
+
+                with err:
+                    SpecialConfig.load(path)
+
+                class AutoConfig(Config):
+                    bytecode_cache = False
+
+                return err, AutoConfig.load(path)
+
+            def should_refuse_to_execute_it(self, topic):
+                expect(topic[0]).to_be_an_error_like(ConfigurationError)
+
+            def should_execute_it_in_auto_mode(self, topic):
+                expect(topic[1].JOINED_PATH).to_equal(join('a', 'b'))
+
+        class WhenFileIsIndented(Vows.Context):
+            def topic(self):
+                path = join(tempfile.mkdtemp(), 'indented.conf')
+
+                with open(path, 'w') as config_file:
+                    config_file.write('X = 1\n  Y = 2\n')
+
+                errors = []
+
+                for mode in ('literal', 'auto', 'exec'):
+                    class SpecialConfig(Config):
+                        bytecode_cache = False
+                        parse_mode = mode
+
+                    try:
+                        SpecialConfig.load(path)
+                    except Exception as error:
+                        errors.append(type(error))
+
+                return errors
+
+            def should_be_rejected_like_python_does(self, topic):
+                expect(topic).to_equal([ConfigurationError, IndentationError, IndentationError])
+
+        class WhenFileHasOtherLineBreaks(Vows.Context):
+            def topic(self):
+                path = join(tempfile.mkdtemp(), 'breaks.conf')
+
+                with open(path, 'w', newline='') as config_file:
+                    config_file.write('X = 1 # note\x0cY = 2\r\nZ = 3\n')
+
+                values = []
+
+                for mode in ('literal', 'auto', 'exec'):
+                    class SpecialConfig(Config):
+                        bytecode_cache = False
+                        parse_mode = mode
+
+                    config = SpecialConfig.load(path)
+                    values.append([config.get(key) for key in ('X', 'Y', 'Z')])
+
+                return values
+
+            def should_read_them_like_python_does(self, topic):
+                expect(topic).to_equal([[1, None, 3]] * 3)
+
     class WhenUsedAsDict(Vows.Context):
         def topic(self):
             return Config.load(fix('sample.conf'))
@@ -231,6 +721,78 @@ class Configuration(Vows.Context):
             def should_be_equal_to_env(self, topic):
                 expect(topic).to_equal("baz")
 
+    class WhenSnapshottingEnvironment(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('SNAPSHOT_WIDTH', 100, 'width')
+            SpecialConfig.define('SNAPSHOT_ENABLED', False, 'enabled')
+            SpecialConfig.define('SNAPSHOT_HOSTS', ['localhost'], 'hosts')
+            SpecialConfig.define('SNAPSHOT_NAME', 'name', 'name')
+
+            os.environ['SNAPSHOT_WIDTH'] = '200'
+            os.environ['SNAPSHOT_ENABLED'] = 'true'
+            os.environ['SNAPSHOT_HOSTS'] = 'a.com, b.com'
+            os.environ['MY_APP_NAME'] = 'from env'
+
+            try:
+                SpecialConfig.allow_environment_variables(snapshot=True, names={
+                    'SNAPSHOT_NAME': 'MY_APP_NAME',
+                })
+                config = SpecialConfig.load(None)
+
+                os.environ['SNAPSHOT_WIDTH'] = '300'
+                before = config.SNAPSHOT_WIDTH
+                SpecialConfig.refresh_environment()
+                after = config.SNAPSHOT_WIDTH
+
+                return config, before, after
+            finally:
+                for name in ('SNAPSHOT_WIDTH', 'SNAPSHOT_ENABLED', 'SNAPSHOT_HOSTS', 'MY_APP_NAME'):
+                    del os.environ[name]
+
+        def should_coerce_to_default_type(self, topic):
+            config = topic[0]
+            expect(config.SNAPSHOT_ENABLED).to_be_true()
+            expect(config.SNAPSHOT_HOSTS).to_equal(['a.com', 'b.com'])
+
+        def should_use_mapped_variable_name(self, topic):
+            expect(topic[0].SNAPSHOT_NAME).to_equal('from env')
+
+        def should_only_change_on_refresh(self, topic):
+            expect(topic[1]).to_equal(200)
+            expect(topic[2]).to_equal(300)
+
+        class WhenValueCannotBeCoerced(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    class_defaults = {}
+                    class_group_items = defaultdict(list)
+                    class_groups = []
+                    class_descriptions = {}
+
+                SpecialConfig.define('SNAPSHOT_INVALID', 100, 'invalid')
+                os.environ['SNAPSHOT_INVALID'] = 'abc'
+
+                err = expect.error_to_happen(ConfigurationError)
+
+                try:
+                    with err:
+                        SpecialConfig.allow_environment_variables(snapshot=True)
+                finally:
+                    del os.environ['SNAPSHOT_INVALID']
+
+                return err
+
+            def should_be_an_error(self, topic):
+                expect(topic).to_be_an_error_like(ConfigurationError)
+
     class WhenReloading(Vows.Context):
         def topic(self):
             class SpecialConfig(Config):
@@ -253,6 +815,835 @@ class Configuration(Vows.Context):
             expect(hasattr(topic, 'UBERFOO')).to_be_true()
             expect(topic.UBERFOO).to_equal('baz')
 
+    class WhenReadingSections(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('STORAGE_S3_BUCKET', 'bucket', 'S3 bucket')
+            SpecialConfig.define('STORAGE_S3_REGION', 'region', 'S3 region')
+            SpecialConfig.alias('OLD_STORAGE_S3_BUCKET', 'STORAGE_S3_BUCKET')
+
+            conf = SpecialConfig(STORAGE_FILE_PATH='/tmp', DETECTOR_ENABLED=True)
+            storage = conf.section('STORAGE')
+            s3 = storage.section('S3')
+            before = sorted(s3)
+
+            conf.STORAGE_S3_KEY = 'key'
+            SpecialConfig.define('STORAGE_S3_ACL', 'private', 'S3 access list')
+
+            return conf, storage, s3, before
+
+        def should_read_keys_without_prefix(self, topic):
+            expect(topic[2].BUCKET).to_equal('bucket')
+            expect(topic[2]['REGION']).to_equal('region')
+            expect(topic[1].FILE_PATH).to_equal('/tmp')
+            expect(topic[0].section('STORAGE_S3_').BUCKET).to_equal('bucket')
+
+        def should_list_keys_from_defaults_and_values(self, topic):
+            expect(topic[3]).to_equal(['BUCKET', 'REGION'])
+            expect(sorted(topic[1])).to_equal(['FILE_PATH', 'S3_ACL', 'S3_BUCKET', 'S3_KEY', 'S3_REGION'])
+
+        def should_follow_values_and_options_added_later(self, topic):
+            expect(sorted(topic[2])).to_equal(['ACL', 'BUCKET', 'KEY', 'REGION'])
+            expect(len(topic[2])).to_equal(4)
+            expect('KEY' in topic[2]).to_be_true()
+            expect(dict(topic[2].items)).to_equal({
+                'ACL': 'private', 'BUCKET': 'bucket', 'KEY': 'key', 'REGION': 'region'
+            })
+
+        def should_leave_out_aliases(self, topic):
+            expect(sorted(topic[0].section('OLD'))).to_equal([])
+
+        def should_read_overrides_and_overlays(self, topic):
+            with topic[0].override(STORAGE_S3_BUCKET='overridden'):
+                expect(topic[2].BUCKET).to_equal('overridden')
+
+            overlay = topic[0].overlay({'STORAGE_S3_BUCKET': 'overlaid'})
+            expect(overlay.section('STORAGE_S3').BUCKET).to_equal('overlaid')
+
+        def should_fail_like_the_configuration(self, topic):
+            expect(topic[2].get('MISSING', 'default')).to_equal('default')
+
+            err = expect.error_to_happen(KeyError)
+
+            with err:
+                topic[2]['MISSING']
+
+            expect(err).to_have_an_error_message_of('"No config called \'STORAGE_S3_MISSING\'"')
+
+    class WhenOverriding(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('QUALITY', 80, 'Image quality')
+            SpecialConfig.alias('OLD_QUALITY', 'QUALITY')
+
+            conf = SpecialConfig(OTHER='other')
+            results = {}
+
+            with conf.override(QUALITY=90, ADDED=lazy(lambda: 'lazy')) as overridden:
+                results['inside'] = (conf.QUALITY, conf.OLD_QUALITY, conf.ADDED, conf.OTHER, overridden is conf)
+                results['items'] = dict(conf.items)
+                results['frozen'] = conf.frozen.QUALITY
+                results['source'] = conf.source_of('QUALITY')
+
+                with conf.override(OLD_QUALITY=95):
+                    results['nested'] = (conf.QUALITY, conf.ADDED)
+
+                thread = threading.Thread(target=lambda: results.update(thread=conf.QUALITY))
+                thread.start()
+                thread.join()
+
+            results['after'] = (conf.QUALITY, 'ADDED' in conf.items, conf.frozen.QUALITY, conf.source_of('QUALITY'))
+
+            async def request(quality):
+                with conf.override(QUALITY=quality):
+                    await asyncio.sleep(0.01)
+                    return conf.QUALITY
+
+            async def requests():
+                return await asyncio.gather(request(1), request(2), request(3))
+
+            results['tasks'] = asyncio.run(requests())
+
+            err = expect.error_to_happen(ConfigurationError)
+
+            with err:
+                with conf.override(items=1):
+                    pass
+
+            results['error'] = err
+
+            return results
+
+        def should_read_overridden_values(self, topic):
+            expect(topic['inside']).to_equal((90, 90, 'lazy', 'other', True))
+
+        def should_include_them_in_items_and_snapshots(self, topic):
+            expect(topic['items']).to_equal({'QUALITY': 90, 'ADDED': 'lazy', 'OTHER': 'other'})
+            expect(topic['frozen']).to_equal(90)
+
+        def should_report_the_override_as_source(self, topic):
+            expect(topic['source']).to_equal('override')
+
+        def should_layer_nested_overrides(self, topic):
+            expect(topic['nested']).to_equal((95, 'lazy'))
+
+        def should_not_leak_into_other_threads(self, topic):
+            expect(topic['thread']).to_equal(80)
+
+        def should_not_leak_into_other_tasks(self, topic):
+            expect(topic['tasks']).to_equal([1, 2, 3])
+
+        def should_restore_values_on_exit(self, topic):
+            expect(topic['after']).to_equal((80, False, 80, 'class defaults'))
+
+        def should_refuse_class_attributes(self, topic):
+            expect(topic['error']).to_have_an_error_message_of('items can not be overridden.')
+
+        class WhenOverlaying(Vows.Context):
+            def topic(self, results):
+                class SpecialConfig(Config):
+                    class_defaults = {}
+
+                conf = SpecialConfig(QUALITY=80, OTHER='other')
+                overlay = conf.overlay({'QUALITY': 90})
+                items = dict(overlay.items)
+                nested = overlay.overlay({'OTHER': 'nested'})
+                conf.OTHER = 'changed'
+
+                return conf, overlay, nested, items
+
+            def should_read_overlaid_values(self, topic):
+                expect(topic[1].QUALITY).to_equal(90)
+                expect(topic[1]['QUALITY']).to_equal(90)
+                expect(topic[1].source_of('QUALITY')).to_equal('overlay')
+
+            def should_read_through_to_the_configuration(self, topic):
+                expect(topic[1].OTHER).to_equal('changed')
+                expect(topic[1].get('MISSING', 'default')).to_equal('default')
+                expect(topic[3]).to_equal({'QUALITY': 90, 'OTHER': 'other'})
+
+            def should_leave_the_configuration_alone(self, topic):
+                expect(topic[0].QUALITY).to_equal(80)
+
+            def should_layer_overlays(self, topic):
+                expect((topic[2].QUALITY, topic[2].OTHER)).to_equal((90, 'nested'))
+
+            def should_be_read_only(self, topic):
+                err = expect.error_to_happen(AttributeError)
+
+                with err:
+                    topic[1].QUALITY = 100
+
+                expect(err).to_have_an_error_message_of('Configuration overlays are read-only.')
+
+    class WhenReloadingAsynchronously(Vows.Context):
+        def topic(self):
+            path = join(tempfile.mkdtemp(), 'async.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write('ASYNC_VALUE = "first"\n')
+
+            async def run():
+                conf = await Config.aload(path)
+                first = conf.ASYNC_VALUE
+                changes = conf.changes()
+                received = asyncio.ensure_future(changes.__anext__())
+
+                with open(path, 'w') as config_file:
+                    config_file.write('ASYNC_VALUE = "second!"\n')
+
+                diff = await conf.areload()
+                change = await asyncio.wait_for(received, 5)
+                await changes.aclose()
+
+                return first, conf.ASYNC_VALUE, diff, change, len(conf._subscribers)
+
+            return asyncio.run(run())
+
+        def should_load(self, topic):
+            expect(topic[0]).to_equal('first')
+
+        def should_reload(self, topic):
+            expect(topic[1]).to_equal('second!')
+            expect(topic[2]).to_equal({'ASYNC_VALUE': ('first', 'second!')})
+
+        def should_notify_subscribers(self, topic):
+            expect(topic[3]).to_equal({'ASYNC_VALUE': ('first', 'second!')})
+
+        def should_unsubscribe_when_closed(self, topic):
+            expect(topic[4]).to_equal(0)
+
+        class WhenAReloadCommitsMeanwhile(Vows.Context):
+            def topic(self):
+                path = join(tempfile.mkdtemp(), 'async.conf')
+
+                with open(path, 'w') as config_file:
+                    config_file.write('ASYNC_VALUE = "first"\n')
+
+                conf = Config.load(path)
+                collect = conf._Config__collect
+
+                def collect_then_reload(force):
+                    # a watcher reloads a newer version while areload is
+                    # still reading the older one
+                    collected = collect(force)
+                    del conf.__dict__['_Config__collect']
+
+                    with open(path, 'w') as config_file:
+                        config_file.write('ASYNC_VALUE = "third!!"\n')
+                    conf.reload()
+
+                    return collected
+
+                with open(path, 'w') as config_file:
+                    config_file.write('ASYNC_VALUE = "second!"\n')
+
+                conf.__dict__['_Config__collect'] = collect_then_reload
+                diff = asyncio.run(conf.areload())
+
+                return conf.ASYNC_VALUE, diff, conf._files[path]['values']
+
+            def should_keep_the_newer_values(self, topic):
+                expect(topic[0]).to_equal('third!!')
+                expect(topic[2]).to_equal({'ASYNC_VALUE': 'third!!'})
+
+            def should_not_apply_the_older_values(self, topic):
+                expect(topic[1]).to_equal({})
+
+        class WhenAnotherThreadIsReloading(Vows.Context):
+            def topic(self):
+                path = join(tempfile.mkdtemp(), 'async.conf')
+
+                with open(path, 'w') as config_file:
+                    config_file.write('ASYNC_VALUE = "first"\n')
+
+                conf = Config.load(path)
+                other = Config.load(path)
+                locked = threading.Event()
+                release = threading.Event()
+
+                def reload_slowly():
+                    # stands for a reload doing file I/O under the lock
+                    with conf._reload_lock:
+                        locked.set()
+                        release.wait(5)
+
+                thread = threading.Thread(target=reload_slowly)
+                thread.start()
+                locked.wait(5)
+
+                with open(path, 'w') as config_file:
+                    config_file.write('ASYNC_VALUE = "second!"\n')
+
+                async def run():
+                    other_diff = await asyncio.wait_for(other.areload(), 5)
+                    task = asyncio.ensure_future(conf.areload())
+                    ticks = 0
+
+                    for index in range(5):
+                        await asyncio.sleep(0.01)
+                        ticks += 1
+
+                    waiting = not task.done()
+                    release.set()
+
+                    return other_diff, ticks, waiting, await asyncio.wait_for(task, 5)
+
+                try:
+                    result = asyncio.run(run())
+                finally:
+                    release.set()
+                    thread.join()
+
+                return result
+
+            def should_not_wait_for_other_configurations(self, topic):
+                expect(topic[0]).to_equal({'ASYNC_VALUE': ('first', 'second!')})
+
+            def should_keep_the_event_loop_running(self, topic):
+                expect(topic[1]).to_equal(5)
+                expect(topic[2]).to_be_true()
+
+            def should_reload_once_the_lock_is_released(self, topic):
+                expect(topic[3]).to_equal({'ASYNC_VALUE': ('first', 'second!')})
+
+    class WhenResolvingValues(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('FIRST', 'first', 'first key')
+            config = SpecialConfig(defaults={'SECOND': 'second'})
+            values = [config.FIRST, config.SECOND]
+
+            SpecialConfig.define('THIRD', 'third', 'third key')
+            SpecialConfig.alias('OLD_FIRST', 'FIRST')
+            config.FIRST = 'changed'
+            config.defaults = {'SECOND': 'other'}
+
+            return values + [config.FIRST, config.SECOND, config.THIRD, config.OLD_FIRST]
+
+        def should_see_registry_and_instance_changes(self, topic):
+            expect(topic).to_equal(['first', 'second', 'changed', 'other', 'third', 'changed'])
+
+        class WhenDefaultIsShadowedByMethod(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    class_defaults = {}
+                    class_group_items = defaultdict(list)
+                    class_groups = []
+                    class_descriptions = {}
+
+                SpecialConfig.define('get', 'default', 'shadowed key')
+
+                return SpecialConfig(defaults={}).get
+
+            def should_be_the_method(self, topic):
+                expect(callable(topic)).to_be_true()
+
+        class WhenDefaultsChangeInPlace(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    class_defaults = {}
+                    class_group_items = defaultdict(list)
+                    class_groups = []
+                    class_descriptions = {}
+
+                SpecialConfig.define('FIRST', 'first', 'first key')
+                config = SpecialConfig(defaults={'SECOND': 'second'})
+                values = [config.FIRST, config.SECOND]
+
+                SpecialConfig.class_defaults['FIRST'] = 'changed'
+                config.defaults['SECOND'] = 'changed'
+                values += [config.FIRST, config.SECOND]
+
+                SpecialConfig.invalidate()
+
+                return values + [config.FIRST, config.SECOND]
+
+            def should_see_them_once_invalidated(self, topic):
+                expect(topic).to_equal(['first', 'second', 'first', 'second', 'changed', 'changed'])
+
+    class WhenReloadingFolder(Vows.Context):
+        def topic(self):
+            folder = tempfile.mkdtemp()
+
+            def write(name, text):
+                with open(join(folder, name), 'w') as config_file:
+                    config_file.write(text)
+
+            write('01-first.conf', 'KEPT = "kept"\nREMOVED = "removed"\nSHADOWED = "first"\n')
+            write('02-second.conf', 'SHADOWED = "second"\nCHANGED = "before"\n')
+
+            config = Config.load(folder)
+            unchanged = config.reload()
+
+            write('02-second.conf', 'CHANGED = "after"\nADDED = "added"\n')
+            write('03-third.conf', 'REMOVED = "moved"\n')
+            os.remove(join(folder, '01-first.conf'))
+            write('01-first.conf', 'KEPT = "kept"\nSHADOWED = "first"\n')
+
+            return config, unchanged, config.reload()
+
+        def should_not_report_unchanged_files(self, topic):
+            expect(topic[1]).to_equal({})
+
+        def should_return_changed_keys(self, topic):
+            expect(topic[2]).to_equal({
+                'REMOVED': ('removed', 'moved'),
+                'SHADOWED': ('second', 'first'),
+                'CHANGED': ('before', 'after'),
+                'ADDED': (None, 'added'),
+            })
+
+        def should_apply_precedence_by_file_name(self, topic):
+            expect(topic[0].SHADOWED).to_equal('first')
+            expect(topic[0].KEPT).to_equal('kept')
+            expect(topic[0].config_file.endswith('03-third.conf')).to_be_true()
+
+        class WhenFilesAreTouched(Vows.Context):
+            def topic(self):
+                import hashlib
+                import derpconf.config as config_module
+
+                folder = tempfile.mkdtemp()
+                path = join(folder, 'touched.conf')
+                hashed = []
+
+                class CountingHashlib(object):
+                    def sha1(self, data):
+                        hashed.append(data)
+                        return hashlib.sha1(data)
+
+                with open(path, 'w') as config_file:
+                    config_file.write('TOUCHED = 1\n')
+                os.utime(path, ns=(1, 1))
+
+                config_module.hashlib = CountingHashlib()
+
+                try:
+                    config = Config.load(folder)
+                    loaded = len(hashed)
+                    state = config._files[path]
+
+                    os.utime(path, ns=(2, 2))
+                    first = (config.reload(), len(hashed))
+
+                    touched = config._files[path]
+                    os.utime(path, ns=(3, 3))
+                    second = (config.reload(), len(hashed), config._files[path]['hash'] is not None)
+                finally:
+                    config_module.hashlib = hashlib
+
+                return loaded, first, second, config._files[path] is not state, touched, config._files[path]
+
+            def should_not_hash_files_when_loading(self, topic):
+                expect(topic[0]).to_equal(0)
+
+            def should_hash_touched_files_on_reload(self, topic):
+                expect(topic[1]).to_equal(({}, 1))
+                expect(topic[2]).to_equal(({}, 2, True))
+                expect(topic[3]).to_be_true()
+
+            def should_not_change_previous_states(self, topic):
+                expect(topic[4]['mtime']).to_equal(2)
+                expect(topic[5]['mtime']).to_equal(3)
+                expect(topic[5]['values'] is topic[4]['values']).to_be_true()
+
+    class WhenLoadingFolderInParallel(Vows.Context):
+        def topic(self):
+            folder = tempfile.mkdtemp()
+
+            for index in range(20):
+                with open(join(folder, '%02d.conf' % index), 'w') as config_file:
+                    config_file.write('SHADOWED = %d\nKEY_%d = %d\n' % (index, index, index))
+
+            return Config.load(folder), Config.load(folder, workers=4)
+
+        def should_load_same_values(self, topic):
+            expect(dict(topic[1].items)).to_equal(dict(topic[0].items))
+
+        def should_keep_file_precedence(self, topic):
+            expect(topic[1].SHADOWED).to_equal(19)
+            expect(topic[1].config_file.endswith('19.conf')).to_be_true()
+
+        def should_time_each_file(self, topic):
+            load_times = topic[1].get_load_times()
+
+            expect(sorted(load_times)).to_equal(sorted(topic[1]._files))
+            expect(len(load_times)).to_equal(20)
+            expect(all(elapsed >= 0 for elapsed in load_times.values())).to_be_true()
+
+        class WhenReloading(Vows.Context):
+            def topic(self):
+                threads = set()
+
+                class ThreadedConfig(Config):
+                    @classmethod
+                    def _read_file(cls, path, format=None):
+                        threads.add(threading.current_thread().name)
+                        return super(ThreadedConfig, cls)._read_file(path, format)
+
+                folder = tempfile.mkdtemp()
+
+                for index in range(4):
+                    with open(join(folder, '%02d.conf' % index), 'w') as config_file:
+                        config_file.write('KEY_%d = %d\n' % (index, index))
+
+                conf = ThreadedConfig.load(folder, workers=2)
+                threads.clear()
+
+                conf.reload(force=True)
+
+                return threads, threading.current_thread().name
+
+            def should_read_with_the_workers_given_to_load(self, topic):
+                expect(topic[0]).not_to_be_empty()
+                expect(topic[1] in topic[0]).to_be_false()
+
+    class WhenLayeringSources(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('FROM_CLASS', 'class', 'Class default')
+            SpecialConfig.alias('OLD_FROM_FILE', 'FROM_FILE')
+
+            path = join(tempfile.mkdtemp(), 'layered.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write('FROM_FILE = "file"\nOVERRIDDEN = "file"\n')
+
+            conf = SpecialConfig.load(path, defaults={'FROM_DEFAULTS': 'defaults', 'FROM_SOURCE': 'defaults'})
+            conf.add_source('remote', {'FROM_SOURCE': 'remote', 'FROM_FILE': 'remote', 'ONLY_REMOTE': 'remote'})
+            conf.add_source('overrides', {'OVERRIDDEN': 'override'}, priority=300)
+            conf.SET_IN_CODE = 'code'
+            conf.OVERRIDDEN = 'code'
+
+            values = dict((key, getattr(conf, key)) for key in (
+                'FROM_CLASS', 'FROM_DEFAULTS', 'FROM_SOURCE', 'FROM_FILE', 'ONLY_REMOTE', 'OVERRIDDEN', 'SET_IN_CODE'
+            ))
+            sources = dict((key, conf.source_of(key)) for key in values)
+            sources['OLD_FROM_FILE'] = conf.source_of('OLD_FROM_FILE')
+
+            layers = conf.get_sources()
+            items = dict(conf.items)
+
+            conf.remove_source('overrides')
+
+            return values, sources, layers, items, (conf.OVERRIDDEN, conf.source_of('OVERRIDDEN')), path
+
+        def should_resolve_by_priority(self, topic):
+            expect(topic[0]).to_equal({
+                'FROM_CLASS': 'class',
+                'FROM_DEFAULTS': 'defaults',
+                'FROM_SOURCE': 'remote',
+                'FROM_FILE': 'file',
+                'ONLY_REMOTE': 'remote',
+                'OVERRIDDEN': 'override',
+                'SET_IN_CODE': 'code',
+            })
+
+        def should_know_where_values_come_from(self, topic):
+            expect(topic[1]).to_equal({
+                'FROM_CLASS': 'class defaults',
+                'FROM_DEFAULTS': 'defaults',
+                'FROM_SOURCE': 'remote',
+                'FROM_FILE': topic[5],
+                'OLD_FROM_FILE': topic[5],
+                'ONLY_REMOTE': 'remote',
+                'OVERRIDDEN': 'overrides',
+                'SET_IN_CODE': 'values',
+            })
+
+        def should_list_sources_by_priority(self, topic):
+            expect(topic[2]).to_equal([
+                (0, 'class defaults'), (100, 'defaults'), (150, 'remote'), (200, 'values'), (300, 'overrides')
+            ])
+
+        def should_include_sources_in_items(self, topic):
+            expect(topic[3]['ONLY_REMOTE']).to_equal('remote')
+            expect(topic[3]['OVERRIDDEN']).to_equal('override')
+
+        def should_fall_back_when_source_is_removed(self, topic):
+            expect(topic[4]).to_equal(('code', 'values'))
+
+        class WhenKeyDoesNotExist(Vows.Context):
+            def topic(self, topic):
+                err = expect.error_to_happen(KeyError)
+
+                with err:
+                    Config().source_of('NOT_A_KEY_ANYWHERE')
+
+                return err
+
+            def should_be_an_error(self, topic):
+                expect(topic).to_be_an_error_like(KeyError)
+
+        class WhenReadingShadowedKeyFirst(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    pass
+
+                conf = SpecialConfig(A='instance')
+                conf.add_source('top', {'A': 'source'}, priority=300)
+                first = conf.A
+
+                other = SpecialConfig(B='instance')
+                SpecialConfig.define('SHADOWING_DEFINED_LATER', 1, 'Defined after the instance')
+                other.add_source('top', {'B': 'source'}, priority=300)
+                SpecialConfig.define('SHADOWING_DEFINED_LAST', 1, 'Defined after the source')
+
+                return first, other.B
+
+            def should_read_the_source(self, topic):
+                expect(topic[0]).to_equal('source')
+
+            def should_read_the_source_after_defines(self, topic):
+                expect(topic[1]).to_equal('source')
+
+    class WhenUsingLazyValues(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+
+            calls = []
+
+            def build_default():
+                calls.append('default')
+                return 'default value'
+
+            SpecialConfig.define('LAZY_DEFAULT', lazy(build_default), 'lazy default')
+
+            path = join(tempfile.mkdtemp(), 'lazy.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write(
+                    'from derpconf.config import lazy\n'
+                    '\n'
+                    '@lazy\n'
+                    'def LAZY_FILE():\n'
+                    '    return ["expensive"]\n'
+                )
+
+            config = SpecialConfig.load(path)
+            wrapper = config._lazy['LAZY_FILE']
+
+            not_found = SpecialConfig.verify(path)
+            text = SpecialConfig.get_config_text()
+            untouched = [wrapper.evaluated, list(calls)]
+
+            values = [config.LAZY_FILE, config.LAZY_FILE, config.LAZY_DEFAULT, config.LAZY_DEFAULT]
+
+            return untouched, not_found, text, values, [wrapper.evaluated, calls]
+
+        def should_not_evaluate_on_load_verify_or_generation(self, topic):
+            expect(topic[0]).to_equal([False, []])
+
+        def should_verify_without_evaluating(self, topic):
+            expect([key for key, value in topic[1]]).to_equal(['LAZY_DEFAULT'])
+
+        def should_show_lazy_values_in_config_text(self, topic):
+            expect(topic[2]).to_include('#LAZY_DEFAULT = lazy(build_default)')
+
+        def should_evaluate_once_on_first_read(self, topic):
+            expect(topic[3]).to_equal([['expensive'], ['expensive'], 'default value', 'default value'])
+            expect(topic[4]).to_equal([True, ['default']])
+
+    class WhenFreezing(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('FROZEN_DEFAULT', ['a', 'b'], 'frozen default')
+            SpecialConfig.alias('OLD_FOO', 'FOO')
+
+            path = join(tempfile.mkdtemp(), 'frozen.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write('FOO = "bar"\n')
+
+            config = SpecialConfig.load(path, defaults={'PROPER': 'PROPERVALUE'})
+            frozen = config.freeze()
+            same = config.frozen
+
+            with open(path, 'w') as config_file:
+                config_file.write('FOO = "changed"\n')
+
+            config.reload()
+
+            return frozen, same, config.frozen
+
+        def should_resolve_every_layer(self, topic):
+            expect(dict(topic[0].items)).to_equal({
+                'FOO': 'bar',
+                'OLD_FOO': 'bar',
+                'PROPER': 'PROPERVALUE',
+                'FROZEN_DEFAULT': ['a', 'b'],
+            })
+            expect(topic[0].FOO).to_equal('bar')
+            expect(topic[0]['PROPER']).to_equal('PROPERVALUE')
+
+        def should_be_read_only(self, topic):
+            with expect.error_to_happen(AttributeError):
+                topic[0].FOO = 'x'
+
+            with expect.error_to_happen(TypeError):
+                topic[0].items['FOO'] = 'x'
+
+        def should_be_hashable(self, topic):
+            expect(hash(topic[0])).to_equal(hash(topic[1]))
+            expect(topic[0]).to_equal(pickle.loads(pickle.dumps(topic[0])))
+
+        def should_reuse_current_snapshot(self, topic):
+            expect(topic[1] is topic[0]).to_be_true()
+
+        def should_swap_snapshot_on_reload(self, topic):
+            expect(topic[0].FOO).to_equal('bar')
+            expect(topic[2].FOO).to_equal('changed')
+
+        class WhenOptionsAreDefinedAfterwards(Vows.Context):
+            def topic(self):
+                class SpecialConfig(Config):
+                    class_defaults = {}
+                    class_group_items = defaultdict(list)
+                    class_groups = []
+                    class_descriptions = {}
+
+                config = SpecialConfig()
+                frozen = config.frozen
+
+                SpecialConfig.define('FROZEN_NEW', 5, 'defined after freezing')
+
+                return frozen, config.frozen
+
+            def should_keep_the_old_snapshot(self, topic):
+                expect('FROZEN_NEW' in topic[0]).to_be_false()
+
+            def should_take_a_new_snapshot(self, topic):
+                expect(topic[1].FROZEN_NEW).to_equal(5)
+
+    class WhenGettingItems(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+
+            SpecialConfig.define('ITEMS_DEFAULT', 'default', 'items default')
+            config = SpecialConfig.load(fix('sample.conf'), defaults={'PROPER': 'PROPERVALUE'})
+
+            first = config.items
+            second = config.items
+
+            SpecialConfig.define('ITEMS_NEW', 'new', 'new items default')
+            config['ITEMS_DEFAULT'] = 'changed'
+
+            return first, second, config.items
+
+        def should_merge_every_layer(self, topic):
+            expect(topic[0]['FOO']).to_equal('bar')
+            expect(topic[0]['PROPER']).to_equal('PROPERVALUE')
+            expect(topic[0]['ITEMS_DEFAULT']).to_equal('default')
+            expect('ITEMS_NEW' in topic[0]).to_be_false()
+
+        def should_not_rebuild_when_unchanged(self, topic):
+            expect(topic[1] is topic[0]).to_be_true()
+
+        def should_be_read_only(self, topic):
+            with expect.error_to_happen(TypeError):
+                topic[0]['FOO'] = 'other'
+
+        def should_rebuild_when_changed(self, topic):
+            expect(topic[2]['ITEMS_NEW']).to_equal('new')
+
+    class WhenValidating(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_schema = {}
+
+            SpecialConfig.define('QUALITY', 80, 'quality', type=int, min_value=0, max_value=100)
+            SpecialConfig.define('ENGINE', 'pil', 'engine', choices=('pil', 'opencv'))
+            SpecialConfig.define('RATIO', 1.0, 'ratio', type=float)
+            SpecialConfig.define('HOSTS', ('localhost',), 'hosts', type=tuple)
+            SpecialConfig.define('SECRET', 'secret', 'secret', validators=[lambda value: len(value) > 4])
+            SpecialConfig.define('UNTYPED', 'untyped', 'untyped')
+
+            path = join(tempfile.mkdtemp(), 'typed.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write(
+                    'QUALITY = "150"\n'
+                    'ENGINE = "imagemagick"\n'
+                    'RATIO = 2\n'
+                    'HOSTS = ["a", "b"]\n'
+                    'SECRET = "abc"\n'
+                    'UNTYPED = "1"\n'
+                )
+
+            config = SpecialConfig.load(path)
+            err = expect.error_to_happen(ValidationError)
+
+            with err:
+                SpecialConfig.load(path, validate=True)
+
+            return config, config.get_validation_errors(), err
+
+        def should_coerce_values_when_loading(self, topic):
+            expect(topic[0].QUALITY).to_equal(150)
+            expect(topic[0].RATIO).to_equal(2.0)
+            expect(topic[0].RATIO).to_be_instance_of(float)
+            expect(topic[0].HOSTS).to_equal(('a', 'b'))
+            expect(topic[0].UNTYPED).to_equal('1')
+
+        def should_report_every_error(self, topic):
+            expect(sorted(topic[1])).to_equal([
+                ('ENGINE', "'imagemagick' is not one of 'pil', 'opencv'"),
+                ('QUALITY', '150 is greater than 100'),
+                ('SECRET', "'abc' is not valid"),
+            ])
+
+        def should_raise_when_validating_on_load(self, topic):
+            expect(topic[2]).to_be_an_error_like(ValidationError)
+            expect(topic[2].error.errors).to_length(3)
+
     class WhenGeneratingConfig(Vows.Context):
         def topic(self):
             class SpecialConfig(Config):
@@ -292,3 +1683,74 @@ class Configuration(Vows.Context):
                 '',
                 ''
             ])
+
+    class WhenWritingConfigText(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('NESTED', ('a', ['b', ('c', 1)]), 'Nested value', 'Nested')
+            first = SpecialConfig.get_config_text()
+            cached = SpecialConfig.get_config_text()
+
+            output = io.StringIO()
+            SpecialConfig.write_config_text(output)
+
+            SpecialConfig.alias('OLD_NESTED', 'NESTED')
+
+            return first, cached, output.getvalue(), SpecialConfig.get_config_text()
+
+        def should_cache_text(self, topic):
+            expect(topic[1] is topic[0]).to_be_true()
+
+        def should_stream_the_same_text(self, topic):
+            expect(topic[2]).to_equal(topic[0])
+
+        def should_format_nested_values(self, topic):
+            expect(topic[0]).to_include(
+                "#NESTED = (\n#    'a',\n#    [\n#        'b',\n#        (\n#            'c',\n#            1,\n"
+                "#        ),\n#    ],\n#)\n"
+            )
+
+        def should_regenerate_when_options_change(self, topic):
+            expect(topic[3]).to_include('## Aliases: OLD_NESTED')
+
+    class WhenImporting(Vows.Context):
+        def topic(self):
+            # a fresh interpreter, as the other vows import everything already
+            output = subprocess.check_output([sys.executable, '-c', (
+                'import sys, derpconf.config as config\n'
+                'print(sorted(set(sys.modules) & {"six", "asyncio", "argparse", "concurrent.futures", "derpconf.formatting"}))\n'
+                'print(config.format_value(("a", 1)).count(","))\n'
+                'print(sorted(set(sys.modules) & {"derpconf.formatting"}))\n'
+            )], env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+
+            return output.decode('utf-8').splitlines()
+
+        def should_leave_out_optional_modules(self, topic):
+            expect(topic[0]).to_equal('[]')
+
+        def should_still_have_formatting_helpers(self, topic):
+            expect(topic[1]).to_equal('2')
+            expect(topic[2]).to_equal("['derpconf.formatting']")
+
+        class WhenExecutingConfigurationFile(Vows.Context):
+            def topic(self):
+                path = join(tempfile.mkdtemp(), 'named.conf')
+
+                with open(path, 'w') as config_file:
+                    config_file.write('NAME = __name__\nHAS_BUILTINS = len("ab")\n')
+
+                class UncachedConfig(Config):
+                    bytecode_cache = False
+
+                return UncachedConfig.load(path)
+
+            def should_run_in_a_plain_namespace(self, topic):
+                expect(topic.NAME).to_equal('configuration')
+                expect(topic.HAS_BUILTINS).to_equal(2)
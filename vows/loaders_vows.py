@@ -0,0 +1,196 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import tempfile
+import shutil
+from os.path import abspath, join, dirname
+
+from pyvows import Vows, expect
+
+from derpconf.config import Config, ConfigurationError
+from derpconf import loaders
+
+fix = lambda name: abspath(join(dirname(__file__), 'fixtures', name))
+
+
+@Vows.batch
+class Loaders(Vows.Context):
+    class WhenLoadingJson(Vows.Context):
+        def topic(self):
+            return Config.load(fix('sample.json'))
+
+        def should_have_values(self, topic):
+            expect(topic.FOO).to_equal('bar')
+            expect(topic.NUMBERS).to_equal([1, 2])
+
+        def should_ignore_lowercase_keys(self, topic):
+            expect(topic.items).not_to_include('lower')
+
+    class WhenLoadingToml(Vows.Context):
+        def topic(self):
+            return Config.load(fix('sample.toml'))
+
+        def should_have_values(self, topic):
+            expect(topic.FOO).to_equal('bar')
+            expect(topic.NUMBERS).to_equal([1, 2])
+
+    class WhenLoadingYaml(Vows.Context):
+        def topic(self):
+            return Config.load(fix('sample.yaml'))
+
+        def should_have_values(self, topic):
+            expect(topic.FOO).to_equal('bar')
+            expect(topic.NUMBERS).to_equal([1, 2])
+
+    class WhenLoadingIni(Vows.Context):
+        def topic(self):
+            return Config.load(fix('sample.ini'))
+
+        def should_have_default_values(self, topic):
+            expect(topic.FOO).to_equal('bar')
+
+        def should_prefix_section_values(self, topic):
+            expect(topic.STORAGE_BUCKET).to_equal('images')
+
+        class WhenSectionOverridesDefault(Vows.Context):
+            def topic(self):
+                path = join(tempfile.mkdtemp(), 'override.ini')
+
+                with open(path, 'w') as config_file:
+                    config_file.write('[DEFAULT]\ntimeout = 1\n\n[storage]\ntimeout = 5\nbucket = images\n')
+
+                return loaders.load_ini(path)
+
+            def should_keep_both_values(self, topic):
+                expect(topic).to_equal({'TIMEOUT': '1', 'STORAGE_TIMEOUT': '5', 'STORAGE_BUCKET': 'images'})
+
+    class WhenLoadingEnv(Vows.Context):
+        def topic(self):
+            return Config.load(fix('sample.env'))
+
+        def should_strip_export_and_quotes(self, topic):
+            expect(topic.FOO).to_equal('bar')
+
+        def should_strip_comments(self, topic):
+            expect(topic.NUMBERS).to_equal('1,2')
+
+    class WhenLoadingStringFormats(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                pass
+
+            SpecialConfig.define('ENABLED', True, 'Enabled')
+            SpecialConfig.define('TIMEOUT', 10, 'Timeout')
+            SpecialConfig.define('TAGS', ['a'], 'Tags')
+            SpecialConfig.define('NAME', 'name', 'Name')
+
+            folder = tempfile.mkdtemp()
+            env_path = join(folder, 'settings.env')
+            ini_path = join(folder, 'settings.ini')
+
+            with open(env_path, 'w') as config_file:
+                config_file.write('ENABLED=false\nTIMEOUT=5\nTAGS=b,c\nNAME=007\n')
+
+            with open(ini_path, 'w') as config_file:
+                config_file.write('[DEFAULT]\nENABLED = no\nTIMEOUT = 7\nUNDEFINED = 1\n')
+
+            env = SpecialConfig.load(env_path)
+            ini = SpecialConfig.load(ini_path)
+
+            with open(ini_path, 'w') as config_file:
+                config_file.write('[DEFAULT]\nENABLED = yes\nTIMEOUT = 8\nUNDEFINED = 1\n')
+
+            ini.reload()
+
+            return env, ini
+
+        def should_convert_to_the_type_of_defaults(self, topic):
+            expect(topic[0].ENABLED).to_equal(False)
+            expect(topic[0].TIMEOUT).to_equal(5)
+            expect(topic[0].TAGS).to_equal(['b', 'c'])
+
+        def should_keep_strings_for_string_options(self, topic):
+            expect(topic[0].NAME).to_equal('007')
+
+        def should_keep_strings_for_unknown_options(self, topic):
+            expect(topic[1].UNDEFINED).to_equal('1')
+
+        def should_convert_on_reload(self, topic):
+            expect(topic[1].ENABLED).to_equal(True)
+            expect(topic[1].TIMEOUT).to_equal(8)
+
+    class WhenFormatIsGiven(Vows.Context):
+        def topic(self):
+            path = join(tempfile.mkdtemp(), 'settings')
+            shutil.copy(fix('sample.json'), path)
+
+            return Config.load(path, format='json')
+
+        def should_use_the_format(self, topic):
+            expect(topic.FOO).to_equal('bar')
+
+    class WhenFormatIsUnknown(Vows.Context):
+        def topic(self):
+            err = expect.error_to_happen(ConfigurationError)
+
+            with err:
+                Config.load(fix('sample.json'), format='xml')
+
+            return err
+
+        def should_be_an_error(self, topic):
+            expect(topic).to_be_an_error_like(ConfigurationError)
+            expect(topic).to_have_an_error_message_of('Unknown configuration format xml.')
+
+    class WhenLoadingMixedFolder(Vows.Context):
+        def topic(self):
+            folder = tempfile.mkdtemp()
+
+            with open(join(folder, '01.conf'), 'w') as config_file:
+                config_file.write('FIRST = 1\nSHARED = "conf"\n')
+
+            with open(join(folder, '02.json'), 'w') as config_file:
+                config_file.write('{"SECOND": 2, "SHARED": "json"}')
+
+            with open(join(folder, 'notes.txt'), 'w') as config_file:
+                config_file.write('NOTES = 3\n')
+
+            return Config.load(folder)
+
+        def should_load_every_format(self, topic):
+            expect(topic.FIRST).to_equal(1)
+            expect(topic.SECOND).to_equal(2)
+
+        def should_apply_files_in_order(self, topic):
+            expect(topic.SHARED).to_equal('json')
+
+        def should_skip_unknown_files(self, topic):
+            expect(topic.items).not_to_include('NOTES')
+
+    class WhenRegisteringLoader(Vows.Context):
+        def topic(self):
+            loaders.register_loader('upper', lambda path: {'UPPER': open(path).read().strip()}, ('.upper',))
+
+            try:
+                path = join(tempfile.mkdtemp(), 'sample.upper')
+
+                with open(path, 'w') as config_file:
+                    config_file.write('value\n')
+
+                return Config.load(path), loaders.is_configuration_file(path)
+            finally:
+                loaders.LOADERS.pop('upper')
+                loaders.EXTENSIONS.pop('.upper')
+
+        def should_load_with_it(self, topic):
+            expect(topic[0].UPPER).to_equal('value')
+
+        def should_list_its_extensions(self, topic):
+            expect(topic[1]).to_be_true()
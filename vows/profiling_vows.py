@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import tempfile
+from os.path import join
+from collections import defaultdict
+
+from pyvows import Vows, expect
+
+from derpconf.config import Config
+
+
+def special_config():
+    class SpecialConfig(Config):
+        class_defaults = {}
+        class_group_items = defaultdict(list)
+        class_groups = []
+        class_descriptions = {}
+        class_aliases = defaultdict(list)
+        class_aliased_items = {}
+        _environment = None
+
+    return SpecialConfig
+
+
+@Vows.batch
+class Profiling(Vows.Context):
+    class WhenProfiling(Vows.Context):
+        def topic(self):
+            SpecialConfig = special_config()
+            SpecialConfig.define('PROFILED', 'default', 'Profiled key')
+            SpecialConfig.alias('OLD_PROFILED', 'PROFILED')
+            SpecialConfig.define('FROM_ENVIRONMENT', 'default', 'Key from the environment')
+
+            path = join(tempfile.mkdtemp(), 'profiled.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write('PROFILED = "loaded"\nif PROFILED:\n    LOADED = True\n')
+
+            with SpecialConfig.profile() as profiler:
+                conf = SpecialConfig.load(path)
+
+                for index in range(3):
+                    conf.PROFILED
+                conf.OLD_PROFILED
+
+                SpecialConfig.allow_environment_variables(snapshot=True)
+                SpecialConfig._environment['FROM_ENVIRONMENT'] = 'environment'
+                conf.FROM_ENVIRONMENT
+
+            conf.PROFILED
+
+            return profiler, path
+
+        def should_count_reads(self, topic):
+            expect(topic[0].reads['PROFILED']).to_equal(3)
+            expect(topic[0].hot_keys(1)).to_equal([('PROFILED', 3)])
+
+        def should_count_aliases(self, topic):
+            expect(topic[0].aliases).to_equal({'OLD_PROFILED': 1})
+
+        def should_count_environment_hits(self, topic):
+            expect(topic[0].environment).to_equal({'FROM_ENVIRONMENT': 1})
+
+        def should_time_files(self, topic):
+            timings = topic[0].as_dict()['files'][topic[1]]
+
+            expect(sorted(timings)).to_equal(['compile', 'exec', 'read', 'total'])
+            expect(timings['total'] >= timings['exec']).to_be_true()
+
+        def should_export_prometheus(self, topic):
+            text = topic[0].to_prometheus()
+
+            expect(text).to_include('derpconf_key_reads_total{key="PROFILED"} 3\n')
+            expect(text).to_include('derpconf_alias_resolutions_total{alias="OLD_PROFILED",key="PROFILED"} 1\n')
+            expect(text).to_include('derpconf_environment_hits_total{key="FROM_ENVIRONMENT"} 1\n')
+            expect(text).to_include('derpconf_file_load_seconds{path="%s",phase="exec"}' % topic[1])
+
+        def should_restore_lookups_when_stopped(self, topic):
+            cls = topic[0].config_class
+
+            expect(topic[0].running).to_be_false()
+            expect('__getattribute__' in cls.__dict__).to_be_false()
+            expect('_read_file' in cls.__dict__).to_be_false()
+
+    class WhenLoadingWithoutProfiler(Vows.Context):
+        def topic(self):
+            path = join(tempfile.mkdtemp(), 'timed.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write('TIMED = 1\n')
+
+            return Config.load(path).get_load_timings()
+
+        def should_still_time_each_phase(self, topic):
+            expect(list(topic.values())[0]['total'] >= 0).to_be_true()
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import json
+import tempfile
+import threading
+from os.path import join
+from http.client import IncompleteRead, BadStatusLine
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from pyvows import Vows, expect
+
+from derpconf.config import Config, ConfigurationError
+from derpconf.remote import RemoteSource, HTTPSource
+
+
+class ConfigServer(object):
+    # a stand-in for a configuration service, answering with ETags
+    def __init__(self, values):
+        self.values = values
+        self.version = 1
+        self.down = False
+        self.requests = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                etag = '"%d"' % server.version
+                server.requests.append(self.headers.get('If-None-Match'))
+
+                if server.down:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                body = json.dumps(server.values).encode('utf-8')
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/config.json' % self.http.server_port
+
+        thread = threading.Thread(target=self.http.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def publish(self, values):
+        self.values = values
+        self.version += 1
+
+    def stop(self):
+        self.http.shutdown()
+        self.http.server_close()
+
+
+class DictSource(RemoteSource):
+    # a key-value store kept in memory, versioned like the real ones
+    def __init__(self, name, values, cache_path=None):
+        super(DictSource, self).__init__(name, cache_path)
+        self.values = values
+        self.version = 1
+
+    def fetch(self, etag=None):
+        if etag == str(self.version):
+            return None
+
+        return dict(self.values), str(self.version)
+
+
+@Vows.batch
+class RemoteSources(Vows.Context):
+    class WhenLoadingFromHTTP(Vows.Context):
+        def topic(self):
+            server = ConfigServer({'QUALITY': 80, 'STORAGE': 'remote'})
+            folder = tempfile.mkdtemp()
+            cache_path = join(folder, 'cache', 'remote.json')
+            path = join(folder, 'local.conf')
+
+            with open(path, 'w') as config_file:
+                config_file.write('QUALITY = 95\n')
+
+            try:
+                conf = Config.load(path, remote=HTTPSource(server.url, cache_path=cache_path))
+                loaded = (conf.QUALITY, conf.STORAGE, conf.source_of('STORAGE'), conf.source_of('QUALITY'))
+
+                unchanged = conf.reload()
+                revalidated = list(server.requests)
+
+                server.publish({'QUALITY': 80, 'STORAGE': 'moved', 'ADDED': True})
+                changed = conf.reload()
+
+                server.down = True
+                offline = (conf.reload(), conf.STORAGE)
+
+                restarted = Config.load(None, remote=HTTPSource(server.url, cache_path=cache_path))
+                restarted = (restarted.STORAGE, restarted.ADDED)
+
+                server.down = False
+                requests = len(server.requests)
+                started = Config.load(None, remote=HTTPSource(server.url, cache_path=cache_path))
+                started = (started.STORAGE, server.requests[requests:])
+            finally:
+                server.stop()
+
+            return {
+                'url': server.url,
+                'path': path,
+                'loaded': loaded,
+                'unchanged': unchanged,
+                'revalidated': revalidated,
+                'changed': changed,
+                'offline': offline,
+                'restarted': restarted,
+                'started': started,
+                'config_file': conf.config_file,
+            }
+
+        def should_layer_files_over_remote_values(self, topic):
+            expect(topic['loaded']).to_equal((95, 'remote', topic['url'], topic['path']))
+
+        def should_revalidate_with_etags(self, topic):
+            expect(topic['unchanged']).to_equal({})
+            expect(topic['revalidated']).to_equal([None, '"1"'])
+
+        def should_apply_only_changed_keys(self, topic):
+            expect(topic['changed']).to_equal({'STORAGE': ('remote', 'moved'), 'ADDED': (None, True)})
+
+        def should_keep_values_when_offline(self, topic):
+            expect(topic['offline']).to_equal(({}, 'moved'))
+
+        def should_start_from_the_cache_when_offline(self, topic):
+            expect(topic['restarted']).to_equal(('moved', True))
+
+        def should_revalidate_the_cache_on_start(self, topic):
+            expect(topic['started']).to_equal(('moved', ['"2"']))
+
+        def should_keep_the_config_file(self, topic):
+            expect(topic['config_file']).to_equal(topic['path'])
+
+    class WhenUsingAKeyValueSource(Vows.Context):
+        def topic(self):
+            source = DictSource('kv', {'STORAGE': 'kv'})
+            conf = Config.load(None, remote=source)
+
+            source.values = {'STORAGE': 'changed'}
+            unchanged = conf.reload()
+
+            source.version += 1
+            changed = conf.reload()
+
+            return conf, unchanged, changed
+
+        def should_load_values(self, topic):
+            expect(topic[0].source_of('STORAGE')).to_equal('kv')
+
+        def should_only_reload_new_versions(self, topic):
+            expect(topic[1]).to_equal({})
+            expect(topic[2]).to_equal({'STORAGE': ('kv', 'changed')})
+
+        def should_time_fetches(self, topic):
+            expect(topic[0].get_load_timings()['kv']['total'] >= 0).to_be_true()
+
+    class WhenUnreachableWithoutCache(Vows.Context):
+        def topic(self):
+            class BrokenSource(RemoteSource):
+                def fetch(self, etag=None):
+                    raise OSError('connection refused')
+
+            err = expect.error_to_happen(ConfigurationError)
+
+            with err:
+                Config.load(None, remote=BrokenSource('broken'))
+
+            return err
+
+        def should_be_an_error(self, topic):
+            expect(topic).to_have_an_error_message_of('Could not fetch configuration from broken: connection refused')
+
+    class WhenTheConnectionBreaksOnReload(Vows.Context):
+        def topic(self):
+            source = DictSource('kv', {'STORAGE': 'kv'})
+            conf = Config.load(None, remote=source)
+            results = []
+
+            for error in (IncompleteRead(b'{"STOR'), BadStatusLine('')):
+                def fetch(etag=None, error=error):
+                    raise error
+
+                source.fetch = fetch
+                results.append((conf.reload(force=True), conf.STORAGE))
+
+            return results
+
+        def should_keep_the_current_values(self, topic):
+            expect(topic).to_equal([({}, 'kv'), ({}, 'kv')])
+
+    class WhenAnsweringWithoutADict(Vows.Context):
+        def topic(self):
+            folder = tempfile.mkdtemp()
+            source = DictSource('kv', {'STORAGE': 'kv'}, cache_path=join(folder, 'kv.json'))
+            conf = Config.load(None, remote=source)
+
+            source.fetch = lambda etag=None: (['not', 'a', 'dict'], '2')
+            reloaded = (conf.reload(), conf.STORAGE)
+            restarted = Config.load(None, remote=source).STORAGE
+
+            source.cache_path = None
+            err = expect.error_to_happen(ConfigurationError)
+
+            with err:
+                Config.load(None, remote=source)
+
+            return reloaded, restarted, err
+
+        def should_keep_the_current_values(self, topic):
+            expect(topic[0]).to_equal(({}, 'kv'))
+
+        def should_use_the_cache_on_start(self, topic):
+            expect(topic[1]).to_equal('kv')
+
+        def should_be_an_error_without_cache(self, topic):
+            expect(topic[2]).to_have_an_error_message_of(
+                'Could not fetch configuration from kv: Configuration from kv must be a dict of values.'
+            )
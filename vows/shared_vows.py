@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import tempfile
+from os.path import abspath, join, dirname
+from collections import defaultdict
+
+from pyvows import Vows, expect
+
+from derpconf.config import Config, ConfigurationError
+from derpconf import shared
+
+fix = lambda name: abspath(join(dirname(__file__), 'fixtures', name))
+
+
+@Vows.batch
+class SharedConfiguration(Vows.Context):
+    class WhenExported(Vows.Context):
+        def topic(self):
+            class SpecialConfig(Config):
+                class_defaults = {}
+                class_group_items = defaultdict(list)
+                class_groups = []
+                class_descriptions = {}
+                class_aliases = defaultdict(list)
+                class_aliased_items = {}
+
+            SpecialConfig.define('SHARED_LIST', ['a', ('b', 1)], 'a list')
+            SpecialConfig.alias('OLD_FOO', 'FOO')
+
+            path = join(tempfile.mkdtemp(), 'config.shared')
+
+            return shared.load(fix('sample.conf'), path, config_class=SpecialConfig, defaults={'PROPER': 'PROPERVALUE'})
+
+        def should_read_values(self, topic):
+            expect(topic.FOO).to_equal('bar')
+            expect(topic['PROPER']).to_equal('PROPERVALUE')
+            expect(topic.SHARED_LIST).to_equal(['a', ('b', 1)])
+
+        def should_read_aliases(self, topic):
+            expect(topic.OLD_FOO).to_equal('bar')
+
+        def should_list_keys(self, topic):
+            expect(topic.keys()).to_equal(['FOO', 'OLD_FOO', 'PROPER', 'SHARED_LIST'])
+            expect(len(topic)).to_equal(4)
+            expect('FOO' in topic).to_be_true()
+            expect('INVALID_KEY' in topic).to_be_false()
+
+        def should_be_read_only(self, topic):
+            with expect.error_to_happen(AttributeError):
+                topic.FOO = 'other'
+
+        def should_raise_for_missing_keys(self, topic):
+            with expect.error_to_happen(KeyError):
+                topic['INVALID_KEY']
+
+            expect(topic.get('INVALID_KEY', 'default')).to_equal('default')
+
+        def should_not_keep_decoded_values(self, topic):
+            for index in range(3):
+                topic.FOO
+                topic['PROPER']
+                topic.get('SHARED_LIST')
+                topic.items
+
+            expect([name for name in topic.__dict__ if not name.startswith('_')]).to_equal([])
+
+    class WhenFileIsNotShared(Vows.Context):
+        def topic(self):
+            err = expect.error_to_happen(ConfigurationError)
+
+            with err:
+                shared.SharedConfig(fix('sample.conf'))
+
+            return err
+
+        def should_be_an_error(self, topic):
+            expect(topic).to_be_an_error_like(ConfigurationError)
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# derpconf
+# https://github.com/globocom/derpconf
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2012 globo.com timehome@corp.globo.com
+
+import time
+import tempfile
+from os.path import join
+
+from pyvows import Vows, expect
+
+from derpconf.config import Config
+from derpconf.watcher import ConfigWatcher
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def write(path, text):
+    with open(path, 'w') as config_file:
+        config_file.write(text)
+
+
+@Vows.batch
+class Watcher(Vows.Context):
+    class WhenFileChanges(Vows.Context):
+        def topic(self):
+            path = join(tempfile.mkdtemp(), 'watched.conf')
+            write(path, 'WATCHED = "first"\n')
+
+            config = Config.load(path)
+            clock = FakeClock()
+            watcher = ConfigWatcher(config, debounce=1.0, clock=clock, use_inotify=False)
+
+            changes = []
+            watcher.on_change(lambda keys, old, new: changes.append((keys, old, new)))
+
+            results = [watcher.check()]
+
+            write(path, 'WATCHED = "second"\n')
+            results.append(watcher.check())
+
+            clock.now = 0.5
+            write(path, 'WATCHED = "third!"\n')
+            results.append(watcher.check())
+
+            clock.now = 1.0
+            results.append(watcher.check())
+
+            clock.now = 1.5
+            results.append(watcher.check())
+
+            return config, results, changes
+
+        def should_debounce_writes(self, topic):
+            expect(topic[1][:4]).to_equal([{}, {}, {}, {}])
+
+        def should_reload_once_settled(self, topic):
+            expect(topic[1][4]).to_equal({'WATCHED': ('first', 'third!')})
+            expect(topic[0].WATCHED).to_equal('third!')
+
+        def should_call_callbacks(self, topic):
+            expect(topic[2]).to_equal([(['WATCHED'], {'WATCHED': 'first'}, {'WATCHED': 'third!'})])
+
+    class WhenFileIsAddedToFolder(Vows.Context):
+        def topic(self):
+            folder = tempfile.mkdtemp()
+            write(join(folder, '01.conf'), 'FIRST = 1\n')
+
+            config = Config.load(folder)
+            clock = FakeClock()
+            watcher = ConfigWatcher(config, debounce=0, clock=clock, use_inotify=False)
+
+            write(join(folder, '02.conf'), 'SECOND = 2\n')
+            watcher.check()
+
+            return watcher.check()
+
+        def should_load_new_file(self, topic):
+            expect(topic).to_equal({'SECOND': (None, 2)})
+
+    class WhenRunningInBackground(Vows.Context):
+        def topic(self):
+            path = join(tempfile.mkdtemp(), 'background.conf')
+            write(path, 'BACKGROUND = "first"\n')
+
+            config = Config.load(path)
+            watcher = config.watch(interval=0.01, debounce=0.01)
+
+            try:
+                write(path, 'BACKGROUND = "second"\n')
+
+                deadline = time.time() + 5
+
+                while config.BACKGROUND != 'second' and time.time() < deadline:
+                    time.sleep(0.01)
+            finally:
+                watcher.stop()
+
+            return config.BACKGROUND
+
+        def should_reload(self, topic):
+            expect(topic).to_equal('second')